@@ -0,0 +1,149 @@
+# The asset durations and event mappings in a local SQLite database, as an
+# alternative to rebuilding the packed catalog (see AssetCatalog in
+# gen-playlist.py) every time asset-info.csv or mapping.xml changes.
+#
+#   assets(name, duration, source)      duration in integer microseconds, NULL when unknown
+#   mappings(event_id, asset, source)   asset NULL for events marked missing
+#   sources(path, size, mtime_ns, sha256, rows)
+#
+# assets and mappings are WITHOUT ROWID tables clustered on name and event_id,
+# so those are the indexes every lookup goes through. Lookups are made one at a
+# time, when the scheduler asks for an event, and nothing is loaded up front.
+#
+# Files are imported incrementally: one that didn't change is skipped; one
+# that only grew (its old contents are a prefix of the new ones, the way an
+# export keeps getting rows appended) only has the new rows read; anything
+# else replaces the rows that came from it. Rows are upserted, so when several
+# files have the same key the last one imported wins.
+#
+# Nothing in here knows the file formats; gen-playlist.py hands over the rows.
+
+import hashlib
+import os
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (name TEXT PRIMARY KEY, duration INTEGER, source TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS mappings (event_id TEXT PRIMARY KEY, asset TEXT, source TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT, rows INTEGER);
+"""
+
+UPSERTS = {
+    "assets": "INSERT INTO assets (name, duration, source) VALUES (?, ?, ?) "
+              + "ON CONFLICT (name) DO UPDATE SET duration = excluded.duration, source = excluded.source",
+    "mappings": "INSERT INTO mappings (event_id, asset, source) VALUES (?, ?, ?) "
+                + "ON CONFLICT (event_id) DO UPDATE SET asset = excluded.asset, source = excluded.source",
+}
+
+
+def file_hashes(path, prefix_size):
+    """
+    (sha256 of the first prefix_size bytes or None if the file is shorter, sha256 of the whole file)
+    """
+    digest = hashlib.sha256()
+    prefix = None
+    read = 0
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if prefix == None and prefix_size != None and read + len(chunk) >= prefix_size:
+                digest.update(chunk[:prefix_size - read])
+                prefix = digest.hexdigest()
+                digest.update(chunk[prefix_size - read:])
+            else:
+                digest.update(chunk)
+            read += len(chunk)
+            if len(chunk) == 0:
+                break
+    return prefix, digest.hexdigest()
+
+
+class AssetDB:
+    """
+    The catalog in the SQLite database at path, created if needed. Answers
+    the same lookups as AssetCatalog. Pickles as just its path (for worker
+    processes), which reconnects without importing anything.
+    """
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def __reduce__(self):
+        return (AssetDB, (self.path,))
+
+    def close(self):
+        self.db.close()
+
+    def upsert(self, table, rows, source):
+        """
+        Upserts (key, value) rows into table ("assets" or "mappings"); returns how many
+        """
+        count = 0
+        def tagged():
+            nonlocal count
+            for key, value in rows:
+                count += 1
+                yield key, value, source
+        self.db.executemany(UPSERTS[table], tagged())
+        return count
+
+    def import_file(self, path, table, read_rows, appendable=False):
+        """
+        Brings table up to date with the file at path. read_rows(path, start)
+        yields its (key, value) rows from byte offset start (a row boundary)
+        on; appendable says whether new rows can just be added at the end of
+        the file (csv, not xml).
+        Returns the number of rows read, 0 if the file didn't change.
+        """
+        stat = os.stat(path)
+        known = self.db.execute("SELECT size, mtime_ns, sha256, rows FROM sources WHERE path = ?", (path,)).fetchone()
+        if known != None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return 0
+        old_size = known[0] if known != None and appendable and known[0] < stat.st_size else None
+        prefix, sha256 = file_hashes(path, old_size)
+        with self.db:
+            if known != None and known[2] == sha256:
+                count = 0 # touched but the same
+                rows = known[3]
+            elif known != None and prefix == known[2] and self.ends_a_row(path, old_size):
+                count = self.upsert(table, read_rows(path, old_size), path)
+                rows = known[3] + count
+            else:
+                self.db.execute(f"DELETE FROM {table} WHERE source = ?", (path,))
+                count = self.upsert(table, read_rows(path, 0), path)
+                rows = count
+            self.db.execute("INSERT OR REPLACE INTO sources (path, size, mtime_ns, sha256, rows) VALUES (?, ?, ?, ?, ?)",
+                            (path, stat.st_size, stat.st_mtime_ns, sha256, rows))
+        return count
+
+    @staticmethod
+    def ends_a_row(path, size):
+        """
+        Whether the first size bytes of path end with a line break, so the rest starts a new row
+        """
+        with open(path, "rb") as f:
+            f.seek(size - 1)
+            return f.read(1) == b"\n"
+
+    def counts(self):
+        """
+        (number of assets, number of mapped events)
+        """
+        return (self.db.execute("SELECT count(*) FROM assets").fetchone()[0],
+                self.db.execute("SELECT count(*) FROM mappings").fetchone()[0])
+
+    def has_event(self, event_id):
+        return self.db.execute("SELECT 1 FROM mappings WHERE event_id = ?", (event_id,)).fetchone() != None
+
+    def event_asset(self, event_id):
+        """
+        (asset name, duration in microseconds or None) of a mapped event
+        """
+        row = self.db.execute("SELECT m.asset, a.duration FROM mappings m LEFT JOIN assets a ON a.name = m.asset "
+                              + "WHERE m.event_id = ?", (event_id,)).fetchone()
+        if row == None:
+            raise KeyError(event_id)
+        return row[0], row[1]
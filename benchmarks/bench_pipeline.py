@@ -0,0 +1,172 @@
+#! /usr/local/bin/python3
+
+# Times every stage of a generator run on synthetic conferences of growing
+# size (see synthetic_conference.py) and writes the timings as json, so runs
+# on different commits can be compared.
+#
+# $ ./benchmarks/bench_pipeline.py [--sizes 300,3000,30000] [--rooms 3] [--seed 2021]
+#                                  [--output results.json] [--compare old-results.json]
+#
+# Stages: parse (schedule.xml), mapping (mapping.xml + asset-info.csv),
+# liveinfo, scheduling, compaction, playlists (making PlaylistEvents and
+# checking overruns), fillers, serialization (room playlist files) and chair
+# (streaming the chair xml).
+
+import argparse
+import contextlib
+import datetime
+import importlib.machinery
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import chain
+
+# Import gen-playlist (and let it find its modules next to it)
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo_dir)
+gen_playlist_file = os.path.join(repo_dir, "gen-playlist.py")
+loader = importlib.machinery.SourceFileLoader( 'gen-playlist.py', gen_playlist_file )
+spec = importlib.util.spec_from_loader( 'gen-playlist.py', loader )
+gpl = importlib.util.module_from_spec( spec )
+loader.exec_module( gpl )
+
+import synthetic_conference
+
+
+class StageTimer:
+    """
+    Adds up the time spent in each stage; the generator's chatter is swallowed
+    """
+    def __init__(self):
+        self.seconds = dict()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+        self.seconds[name] = self.seconds.get(name, 0) + time.perf_counter() - start
+
+
+def run_pipeline(directory, rooms):
+    """
+    One generator run over the inputs in directory, stage by stage.
+    Returns (seconds per stage, counts).
+    """
+    timer = StageTimer()
+    gpl.room_ids = rooms
+    room_names = [gpl.base_room + r for r in rooms]
+
+    with timer.stage("parse"):
+        timezone_id, subevents = gpl.load_schedule(os.path.join(directory, "schedule.xml"))
+    with timer.stage("mapping"):
+        mapping = gpl.VideoMapping.from_files(os.path.join(directory, "mapping.xml"),
+                                              os.path.join(directory, "asset-info.csv"))
+    with timer.stage("liveinfo"):
+        scheduler = gpl.Scheduler.from_file(os.path.join(directory, "liveinfo.xml"))
+
+    with timer.stage("scheduling"):
+        schedule = gpl.schedule_subevents(scheduler, mapping, subevents, room_names)
+    with timer.stage("compaction"):
+        schedule = gpl.compact_rooms(scheduler, schedule)
+
+    with timer.stage("playlists"):
+        room_playlists = gpl.make_room_playlists(schedule)
+
+    fillers = dict()
+    with timer.stage("fillers"):
+        for r in rooms:
+            fillers[r] = gpl.gen_fillers(r, room_playlists.get(gpl.base_room + r, []))
+
+    events = 0
+    with timer.stage("serialization"):
+        for r in rooms:
+            room_events = [evt for evt in chain(room_playlists.get(gpl.base_room + r, []), fillers[r])
+                           if evt.duration.total_seconds() > 0]
+            events += len(room_events)
+            gpl.write_playlist_xml(os.path.join(directory, f"playlist-{r}.xml"), gpl.base_room + r, room_events)
+
+    with timer.stage("chair"):
+        gpl.write_chair(os.path.join(directory, "chair.xml"), room_playlists, scheduler, timezone_id)
+
+    counts = { "subevents": len(subevents)
+             , "timeslots": sum(len(se.timeslots) for se in subevents)
+             , "events": events
+             , "fillers": sum(len(f) for f in fillers.values()) }
+    return timer.seconds, counts
+
+def bench(size, rooms, seed, repeat):
+    """
+    The best of repeat runs (per stage) on a synthetic conference of about size timeslots
+    """
+    conf = synthetic_conference.generate(size, rooms, seed)
+    with tempfile.TemporaryDirectory(prefix="playlist-bench-") as directory:
+        synthetic_conference.write_conference(conf, directory)
+        best = None
+        for _ in range(repeat):
+            seconds, counts = run_pipeline(directory, conf.rooms)
+            if best == None:
+                best = seconds
+            else:
+                best = {stage: min(best[stage], seconds[stage]) for stage in best}
+    best["total"] = sum(best.values())
+    return { "size": size, "rooms": rooms, "seed": seed, "counts": counts
+           , "seconds": {stage: round(s, 6) for stage, s in best.items()} }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, previous=None):
+    old = dict()
+    if previous != None:
+        old = {(r["size"], r["rooms"], r["seed"]): r["seconds"] for r in previous["results"]}
+    for result in results:
+        counts = result["counts"]
+        print(f"{counts['timeslots']} timeslots, {result['rooms']} rooms, {counts['events']} events:")
+        before = old.get((result["size"], result["rooms"], result["seed"]), dict())
+        for stage, seconds in result["seconds"].items():
+            line = f"  {stage:>14}: {seconds:8.3f}s"
+            if stage in before and before[stage] > 0:
+                line += f"  ({seconds / before[stage]:.2f}x of before)"
+            print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the playlist generator's stages on synthetic conferences")
+    parser.add_argument("--sizes", default="300,3000,30000",
+                        help="comma separated numbers of timeslots (default: 300,3000,30000)")
+    parser.add_argument("--rooms", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=2021)
+    parser.add_argument("--repeat", type=int, default=1, help="keep the best of N runs (default: 1)")
+    parser.add_argument("--output", help="write the results as json to this file")
+    parser.add_argument("--compare", help="json results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.append(bench(size, args.rooms, args.seed, args.repeat))
+
+    previous = None
+    if args.compare != None:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_results(results, previous)
+
+    report = { "commit": git_commit()
+             , "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+             , "python": platform.python_version()
+             , "machine": platform.machine()
+             , "results": results }
+    if args.output != None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
@@ -0,0 +1,143 @@
+#! /usr/local/bin/python3
+
+# Times PlaylistEvent.to_xml (cloning the event template) and
+# PlaylistEvent.to_xml_bytes (formatting the serialized template) against
+# building every <event> element by element like the generator used to,
+# and the integer frame timecodes against the float/strftime ones.
+#
+# $ ./benchmarks/bench_to_xml.py [number of events]
+
+import datetime
+import importlib.machinery
+import importlib.util
+import math
+import os
+import sys
+import time
+
+import dateutil.tz as TZ
+import lxml.etree as ET
+
+# Import gen-playlist (and let it find its modules next to it)
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, repo_dir)
+gen_playlist_file = os.path.join(repo_dir, "gen-playlist.py")
+loader = importlib.machinery.SourceFileLoader( 'gen-playlist.py', gen_playlist_file )
+spec = importlib.util.spec_from_loader( 'gen-playlist.py', loader )
+gpl = importlib.util.module_from_spec( spec )
+loader.exec_module( gpl )
+
+
+def to_xml_by_element(evt):
+    """
+    The old PlaylistEvent.to_xml: ~18 ET.Element calls per event
+    """
+    event = ET.Element("event")
+    duration = ET.Element("duration")
+    duration.text = gpl.timecode.format_duration(gpl.timecode.timedelta_to_frames(evt.duration))
+    title = ET.Element("title")
+    title.text = evt.title
+    category_type, id_tag, source_id = evt.source.playlist_id()
+    idel = ET.Element(id_tag)
+    idel.text = source_id
+    category = ET.Element("category")
+    category.text = category_type
+    onairtime = ET.Element("onairtime")
+    onairtime.text = gpl.timecode.format_onairtime(gpl.timecode.datetime_to_frames(evt.onairtime))
+    recordingpat = ET.Element("recordingPattern")
+    recordingpat.text = evt.recording if evt.recording != None else ""
+    offset = ET.Element("offset")
+    offset.text = "00:00:00:00"
+    endmode = ET.Element("endmode")
+    endmode.text = "FOLLOW"
+    igincomsig = ET.Element("ignoreincomingscte35signals")
+    igincomsig.text = "false"
+    maxExtendedDuration = ET.Element("maxExtendedDuration")
+    maxExtendedDuration.text = "00:00:00:00"
+    scte35list = ET.Element("scte35list")
+    secondaryeventlist = ET.Element("secondaryeventlist")
+    som = ET.Element("som")
+    som.text = "00:00:00:00"
+    startmode = ET.Element("startmode")
+    startmode.text = "FOLLOW"
+    twitchrpclist = ET.Element("twitchrpclist")
+    untimedAdList = ET.Element("untimedAdList")
+    voiceoverlist = ET.Element("voiceoverlist")
+    playoutswithlist = ET.Element("playoutswitchlist")
+    recording = ET.Element("recording")
+    recording.text = "true" if evt.recording != None else "false"
+    event.extend (
+          [ category, title, duration, onairtime, idel, recordingpat ]
+        + [ offset, endmode, igincomsig, maxExtendedDuration, scte35list
+            , som, playoutswithlist, startmode, recording
+            , twitchrpclist, untimedAdList, voiceoverlist ]
+    )
+    return event
+
+def float_timecodes(evt):
+    """
+    How the timecodes used to be made: float seconds, astimezone and strftime
+    """
+    total_secs = evt.duration.total_seconds()
+    hours,remainder = divmod(total_secs, 60*60)
+    minutes,remainder = divmod(remainder, 60)
+    seconds,fractional_seconds = divmod(remainder, 1)
+    frames = math.floor(fractional_seconds*25)
+    duration = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}:{int(frames):02d}"
+    time_text = evt.onairtime.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+    frames = math.floor((evt.onairtime.microsecond * 25)/1000000)
+    return duration, f"{time_text}:{frames:02d}"
+
+def frame_timecodes(evt):
+    timecode = gpl.timecode
+    return (timecode.format_duration(timecode.timedelta_to_frames(evt.duration)),
+            timecode.format_onairtime(timecode.datetime_to_frames(evt.onairtime)))
+
+def make_events(n):
+    """
+    n back to back events alternating between prerecorded videos and live rooms
+    """
+    tz = TZ.gettz("America/Chicago")
+    now = datetime.datetime(2021, 10, 17, 9, 0, tzinfo=tz)
+    room = gpl.EventRoom("Swissotel Chicago | Zurich C", "ROOMC", "FILLERC")
+    events = []
+    for i in range(n):
+        duration = datetime.timedelta(minutes=5 + i % 20, seconds=i % 60, milliseconds=40 * (i % 25))
+        if i % 2 == 0:
+            source = gpl.PrerecordedVideo(f"paper-{i}-video", duration)
+            events.append(gpl.PlaylistEvent(f"Paper {i}", source, "PROGRAM", duration, "FOLLOW", now, None, None))
+        else:
+            events.append(gpl.PlaylistEvent(f"Live: Paper {i}", room, "LIVE", duration, "FOLLOW", now, None, None, recording=f"event-{i}"))
+        now += duration
+    return events
+
+def to_indented_bytes(event):
+    ET.indent(event, level=2)
+    return b"\n    " + ET.tostring(event, encoding="utf-8")
+
+def bench(name, fn, events):
+    start = time.perf_counter()
+    out = [fn(evt) for evt in events]
+    elapsed = time.perf_counter() - start
+    print(f"{name:>20}: {elapsed:.3f}s ({1e6 * elapsed / len(events):.1f}us/event)")
+    return out, elapsed
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    events = make_events(n)
+    print(f"serializing {n} events")
+    by_element, t_by_element = bench("element by element", to_xml_by_element, events)
+    templated, t_templated = bench("template", gpl.PlaylistEvent.to_xml, events)
+    serialized, t_serialized = bench("byte template", gpl.PlaylistEvent.to_xml_bytes, events)
+    # element paths are timed without serializing, the byte template includes it
+    _, t_tostring = bench("(indent+tostring)", to_indented_bytes, by_element)
+    for old, new, raw in zip(by_element, templated, serialized):
+        old = to_indented_bytes(old)
+        if old != to_indented_bytes(new) or old != raw:
+            raise RuntimeError(f"template output differs:\n{old}\n{to_indented_bytes(new)}\n{raw}")
+    floats, t_floats = bench("float timecodes", float_timecodes, events)
+    frames, t_frames = bench("frame timecodes", frame_timecodes, events)
+    drifted = sum(1 for old, new in zip(floats, frames) if old != new)
+    print(f"template speedup: {t_by_element / t_templated:.1f}x")
+    print(f"byte template speedup (including serialization): {(t_by_element + t_tostring) / t_serialized:.1f}x")
+    print(f"frame timecode speedup: {t_floats / t_frames:.1f}x ({drifted} events were a frame short with floats)")
@@ -0,0 +1,107 @@
+#! /usr/local/bin/python3
+
+# Checks that an --incremental run after an edit writes the same files as a
+# full run. On a copy of the inputs: a first --incremental run fills the
+# schedule cache, a few asset durations in asset-info.csv get shortened, then
+# --incremental runs again (reusing every subevent the edit didn't touch) and
+# its outputs are compared byte for byte with those of a run without cache.
+#
+# $ ./benchmarks/check_incremental.py [INPUT_DIR] [--edits 2] [--keep]
+#
+# INPUT_DIR defaults to the inputs at the top of the repo.
+
+import argparse
+import csv
+import datetime
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+repo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+gen_playlist_file = os.path.join(repo_dir, "gen-playlist.py")
+INPUT_FILES = ["schedule.xml", "mapping.xml", "liveinfo.xml", "asset-info.csv"]
+
+
+def generate(directory, *args):
+    """
+    Runs the generator in directory; returns its output files (name => bytes)
+    """
+    run = subprocess.run([sys.executable, gen_playlist_file, *args], cwd=directory, capture_output=True, text=True)
+    if run.returncode != 0:
+        raise RuntimeError(f"gen-playlist.py {' '.join(args)} failed:\n{run.stdout[-2000:]}{run.stderr[-2000:]}")
+    outputs = dict()
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path) and not name in INPUT_FILES:
+            with open(path, "rb") as f:
+                outputs[name] = f.read()
+    return outputs
+
+def shorten_assets(asset_info, mapping, edits):
+    """
+    Takes 20 seconds off the durations of the first edits assets of asset_info
+    that mapping.xml refers to; returns their names
+    """
+    with open(mapping) as f:
+        mapped = f.read()
+    with open(asset_info, newline="") as f:
+        rows = list(csv.reader(f))
+    duration = rows[0].index("Duration")
+    edited = []
+    for row in rows[1:]:
+        if len(edited) == edits:
+            break
+        if len(row) <= duration or not row[0] in mapped:
+            continue
+        hms, _, fraction = row[duration].partition(".")
+        hours, minutes, seconds = (int(x) for x in hms.split(":"))
+        length = datetime.timedelta(hours=hours, minutes=minutes, seconds=seconds)
+        if length <= datetime.timedelta(seconds=20):
+            continue
+        length -= datetime.timedelta(seconds=20)
+        row[duration] = f"{str(length)}.{fraction}" if fraction else str(length)
+        edited.append(row[0])
+    with open(asset_info, "w", newline="") as f:
+        csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n").writerows(rows)
+    return edited
+
+def check(input_dir, edits, keep=False):
+    work = tempfile.mkdtemp(prefix="check-incremental-")
+    try:
+        incremental, full = os.path.join(work, "incremental"), os.path.join(work, "full")
+        os.makedirs(incremental)
+        for name in INPUT_FILES:
+            shutil.copy(os.path.join(input_dir, name), incremental)
+        generate(incremental, "--incremental")
+        edited = shorten_assets(os.path.join(incremental, "asset-info.csv"), os.path.join(incremental, "mapping.xml"), edits)
+        print(f"shortened {', '.join(edited)}")
+        shutil.copytree(incremental, full, ignore=shutil.ignore_patterns(".playlist-cache"))
+
+        after_edit = generate(incremental, "--incremental")
+        expected = generate(full)
+        different = [name for name in sorted(set(after_edit) | set(expected))
+                     if after_edit.get(name) != expected.get(name)]
+        for name in sorted(expected):
+            print(f"{name}: {'DIFFERENT' if name in different else 'same'}")
+        return len(different) == 0
+    finally:
+        if keep:
+            print(f"kept {work}")
+        else:
+            shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Checks that --incremental after an edit matches a full run")
+    parser.add_argument("input_dir", nargs="?", default=repo_dir,
+                        help="directory with schedule.xml, mapping.xml, liveinfo.xml and asset-info.csv (default: the repo's)")
+    parser.add_argument("--edits", type=int, default=2, help="how many asset durations to change (default: 2)")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory to look at")
+    args = parser.parse_args()
+    if not check(args.input_dir, args.edits, args.keep):
+        print("--incremental doesn't match a full run")
+        sys.exit(1)
+    print("--incremental matches a full run")
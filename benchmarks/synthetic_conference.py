@@ -0,0 +1,236 @@
+#! /usr/local/bin/python3
+
+# Writes a made up (but seeded, so reproducible) conference in the shape of
+# the real inputs: schedule.xml, mapping.xml, liveinfo.xml and asset-info.csv.
+#
+# Every day starts with a plenary keynote in the first room (played in every
+# room, mirrored as a prerecording in the evening), followed by sessions of
+# papers in every room. Paper tracks are compact_recorded and mix in-person
+# talks (half of them without a video), virtual talks with backups (some of
+# their videos have no known duration) and a live Q&A; some sessions are
+# mirrored in another room later in the day.
+#
+# $ ./benchmarks/synthetic_conference.py OUTPUT_DIR [--timeslots N] [--rooms R] [--seed S]
+
+import argparse
+import datetime
+import os
+import random
+import uuid
+from xml.sax.saxutils import escape
+
+TIMEZONE = "America/Chicago"
+FIRST_DAY = datetime.date(2021, 10, 17)
+BASE_ROOM = "Swissotel Chicago | Zurich "
+
+DAY_START = 9 * 60 # minutes
+KEYNOTE_END = 10 * 60
+DAY_END = 17 * 60
+MIRROR_START = 18 * 60
+MIRROR_END = 22 * 60
+SESSION_TALKS = 6
+
+PAPER_TRACKS = 4
+WORKSHOP_TRACKS = 2
+QA_TITLE = "Discussion, Questions and Answers"
+
+
+def room_ids(rooms):
+    return [f"R{i:03d}" for i in range(rooms)]
+
+
+class Conference:
+    """
+    The schedule as plain data, filled in by generate()
+    """
+    def __init__(self, rooms):
+        self.rooms = rooms
+        self.subevents = [] # (subevent_id, title, room, date, track, [timeslot dict])
+        self.mappings = [] # (event_id, "confpub"|"missing"|"manual", id)
+        self.assets = [] # (name, duration in seconds)
+        self.timeslots = 0
+
+
+def make_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def hhmm(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def generate(timeslots, rooms, seed):
+    """
+    A Conference with about timeslots timeslots spread over rooms rooms
+    """
+    rng = random.Random(seed)
+    conf = Conference(room_ids(rooms))
+    day = 0
+    paper = 0
+    while conf.timeslots < timeslots:
+        date = (FIRST_DAY + datetime.timedelta(days=day)).strftime("%Y/%m/%d")
+        day += 1
+
+        # the keynote, for every room
+        keynote_id = make_uuid(rng)
+        keynote = dict(slot_id=make_uuid(rng), event_id=keynote_id, title=f"Keynote {day}",
+                       room=conf.rooms[0], date=date, start=DAY_START, end=KEYNOTE_END, badges=["In-Person"])
+        conf.subevents.append((make_uuid(rng), f"Keynote {day}", conf.rooms[0], date, "Keynotes", [keynote]))
+        conf.timeslots += 1
+        mirrored = [] # sessions to mirror in the evening
+
+        for room in conf.rooms:
+            start = KEYNOTE_END
+            while start < DAY_END and conf.timeslots < timeslots:
+                if rng.random() < 0.8:
+                    track = f"Research Papers {rng.randrange(PAPER_TRACKS)}"
+                else:
+                    track = f"Workshop {rng.randrange(WORKSHOP_TRACKS)}"
+                session = []
+                for _ in range(SESSION_TALKS):
+                    length = rng.choice((10, 15, 15, 20))
+                    if start + length > DAY_END:
+                        break
+                    paper += 1
+                    event_id = make_uuid(rng)
+                    badge = "Virtual" if rng.random() < 0.5 else "In-Person"
+                    session.append(dict(slot_id=make_uuid(rng), event_id=event_id, title=f"Paper {paper}",
+                                        room=room, date=date, start=start, end=start + length, badges=[badge]))
+                    add_mapping(conf, rng, event_id, f"synth21-p{paper}-p", length, badge)
+                    start += length
+                if start + 10 <= DAY_END:
+                    session.append(dict(slot_id=make_uuid(rng), event_id=make_uuid(rng), title=QA_TITLE,
+                                        room=room, date=date, start=start, end=start + 10, badges=[]))
+                    start += 10
+                if len(session) == 0:
+                    break
+                conf.subevents.append((make_uuid(rng), f"{track} session {len(conf.subevents)}", room, date, track, session))
+                conf.timeslots += len(session)
+                if track.startswith("Research") and rng.random() < 0.1:
+                    mirrored.append(session)
+
+        # mirrors in the evening, in another room
+        # (the keynote's mirror is plenary too, so the sessions come after it)
+        keynote_mirror = dict(keynote, slot_id=make_uuid(rng), start=MIRROR_START, end=MIRROR_START + 60, is_mirror=True)
+        conf.subevents.append((make_uuid(rng), f"Keynote {day} (mirror)", conf.rooms[0], date, "Keynotes", [keynote_mirror]))
+        conf.timeslots += 1
+        for room in conf.rooms:
+            start = MIRROR_START + 60
+            while len(mirrored) > 0 and conf.timeslots < timeslots:
+                session = mirrored[-1]
+                length = session[-1]["end"] - session[0]["start"]
+                if start + length > MIRROR_END:
+                    break
+                mirrored.pop()
+                offset = start - session[0]["start"]
+                mirror = [dict(ts, slot_id=make_uuid(rng), room=room, start=ts["start"] + offset,
+                               end=ts["end"] + offset, is_mirror=True) for ts in session]
+                conf.subevents.append((make_uuid(rng), f"Research Papers mirror {len(conf.subevents)}", room, date,
+                                       f"Research Papers {rng.randrange(PAPER_TRACKS)}", mirror))
+                conf.timeslots += len(mirror)
+                start += length
+    return conf
+
+def add_mapping(conf, rng, event_id, confpub_id, length, badge):
+    roll = rng.random()
+    if badge == "In-Person" and roll < 0.5:
+        # given live in the room, nothing to play
+        conf.mappings.append((event_id, "missing", None))
+    elif roll < 0.05:
+        # no asset-info.csv row, so no duration: backups kick in
+        conf.mappings.append((event_id, "confpub", confpub_id))
+    else:
+        conf.mappings.append((event_id, "confpub", confpub_id))
+        # mostly shorter than the slot (compaction), sometimes longer (clipped)
+        duration = length * 60 * rng.uniform(0.6, 1.1)
+        conf.assets.append((f"{confpub_id}-video", duration))
+
+
+def write_schedule(conf, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<event>\n')
+        f.write('  <event_details>\n    <title>SYNTH 2021</title>\n    <acronym>SYNTH 2021</acronym>\n'
+                + '    <event_type type="conference"/>\n  </event_details>\n')
+        for subevent_id, title, room, date, track, timeslots in conf.subevents:
+            f.write(f'  <subevent>\n    <subevent_id>{subevent_id}</subevent_id>\n    <title>{escape(title)}</title>\n'
+                    + f'    <subevent_type type="regular"/>\n    <room>{BASE_ROOM}{room}</room>\n    <date>{date}</date>\n'
+                    + f'    <tracks>\n      <track>{escape(track)}</track>\n    </tracks>\n')
+            for ts in timeslots:
+                mirror = ' is_mirror="true"' if ts.get("is_mirror") else ''
+                badges = "".join(f'        <badge property="Event Form">{b}</badge>\n' for b in ts["badges"])
+                if badges != "":
+                    badges = f'      <badges>\n{badges}      </badges>\n'
+                f.write(f'    <timeslot{mirror}>\n      <slot_id>{ts["slot_id"]}</slot_id>\n'
+                        + f'      <event_id>{ts["event_id"]}</event_id>\n      <title>{escape(ts["title"])}</title>\n'
+                        + f'      <room>{BASE_ROOM}{ts["room"]}</room>\n      <date>{ts["date"]}</date>\n'
+                        + f'      <start_time>{hhmm(ts["start"])}</start_time>\n      <end_date>{ts["date"]}</end_date>\n'
+                        + f'      <end_time>{hhmm(ts["end"])}</end_time>\n'
+                        + f'      <tracks>\n        <track>{escape(track)}</track>\n      </tracks>\n{badges}    </timeslot>\n')
+            f.write('  </subevent>\n')
+        f.write(f'  <timezone_id>{TIMEZONE}</timezone_id>\n</event>\n')
+
+def write_mapping(conf, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<matching>\n')
+        for event_id, kind, source_id in conf.mappings:
+            source = "<missing/>" if kind == "missing" else f'<confpub id="{source_id}"/>'
+            f.write(f'  <match event_id="{event_id}">\n    {source}\n  </match>\n')
+        f.write('</matching>\n')
+
+def write_asset_info(conf, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('"Name","Size (bytes)","QC status","Times scheduled","Version","Duration","TC In","Created","Updated"\n')
+        for name, seconds in conf.assets:
+            hundredths = int(seconds * 100)
+            duration = f"{hundredths // 360000}:{hundredths // 6000 % 60:02d}:{hundredths // 100 % 60:02d}.{hundredths % 100:02d}"
+            f.write(f'"{name}","1000000","OK","0","1","{duration}","0:00:00.00","2021-10-01T00:00:00","2021-10-01T00:00:00"\n')
+
+def write_liveinfo(conf, path):
+    rooms = "".join(f'\t\t<room name="{BASE_ROOM}{r}" live="LIVE{r}" filler="FILLER{r}"/>\n' for r in conf.rooms)
+    zooms = "".join(f'\t\t\t<zoom room="{BASE_ROOM}{r}" url="https://example.org/j/{r}" stream="ZOOM{r}"/>\n'
+                    for r in conf.rooms)
+    events = []
+    for k in range(PAPER_TRACKS):
+        events.append(f'''\t\t<event name="Research Papers {k}" compact_recorded="true">
+{zooms}\t\t\t<format name="{QA_TITLE}"><live source="zoom"/></format>
+\t\t\t<format mirror="true"><prerecorded source="mirror"/></format>
+\t\t\t<format badge="In-Person"><live source="room" record="{{timeslot.event_id}}"/></format>
+\t\t\t<format badge="Virtual">
+\t\t\t\t<prerecorded>
+\t\t\t\t\t<backup><live source="zoom" record="{{timeslot.event_id}}"/></backup>
+\t\t\t\t</prerecorded>
+\t\t\t</format>
+\t\t\t<format><prerecorded/></format>
+\t\t</event>
+''')
+    for k in range(WORKSHOP_TRACKS):
+        events.append(f'''\t\t<event name="Workshop {k}">
+{zooms}\t\t\t<format name="{QA_TITLE}"><live source="zoom"/></format>
+\t\t\t<format><live source="zoom" record="{{timeslot.event_id}}"/></format>
+\t\t</event>
+''')
+    events.append('''\t\t<event name="Keynotes">
+\t\t\t<format mirror="true"><prerecorded plenary="true" source="mirror"/></format>
+\t\t\t<format><live source="room" plenary="true" record="{timeslot.event_id}"/></format>
+\t\t</event>
+''')
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f'<liveinfo>\n\t<mirroring start="09:00:00" end="17:00:00" timezone="{TIMEZONE}"/>\n'
+                + f'\t<rooms>\n{rooms}\t</rooms>\n\t<events>\n{"".join(events)}\t</events>\n</liveinfo>\n')
+
+def write_conference(conf, directory):
+    os.makedirs(directory, exist_ok=True)
+    write_schedule(conf, os.path.join(directory, "schedule.xml"))
+    write_mapping(conf, os.path.join(directory, "mapping.xml"))
+    write_asset_info(conf, os.path.join(directory, "asset-info.csv"))
+    write_liveinfo(conf, os.path.join(directory, "liveinfo.xml"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic conference's generator inputs")
+    parser.add_argument("directory")
+    parser.add_argument("--timeslots", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=2021)
+    args = parser.parse_args()
+    conf = generate(args.timeslots, args.rooms, args.seed)
+    write_conference(conf, args.directory)
+    print(f"wrote {conf.timeslots} timeslots in {len(conf.subevents)} subevents over {len(conf.rooms)} rooms to {args.directory}")
@@ -0,0 +1,125 @@
+# Waits for changes to a handful of files (the generator's inputs).
+#
+# Uses inotify on Linux (straight through libc, no extra dependencies) and
+# falls back to polling os.stat everywhere else.
+# Editors tend to save by writing a new file and renaming it over the old
+# one, so inotify watches the directories the files live in, not the files.
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    def __init__(self, paths):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.dirs = dict() # watch descriptor => directory
+        for directory in set(os.path.dirname(p) for p in self.paths):
+            wd = libc.inotify_add_watch(self.fd, directory.encode(), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+            self.dirs[wd] = directory
+
+    def poll(self, timeout):
+        """
+        Returns the set of watched paths that changed, waiting at most timeout seconds for one
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode()
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return set(self.paths)
+            path = os.path.join(self.dirs.get(wd, ""), name)
+            if path in self.paths:
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    def __init__(self, paths, interval=0.25):
+        self.paths = [os.path.abspath(p) for p in paths]
+        self.interval = interval
+        self.stats = {p: self.stat(p) for p in self.paths}
+
+    def stat(self, path):
+        try:
+            stat = os.stat(path)
+            return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        except OSError:
+            return None
+
+    def poll(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path in self.paths:
+                stat = self.stat(path)
+                if stat != self.stats[path]:
+                    self.stats[path] = stat
+                    changed.add(path)
+            remaining = deadline - time.monotonic()
+            if len(changed) > 0 or remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def make_watcher(paths):
+    """
+    An inotify watcher where the platform has one, a polling one otherwise
+    """
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError, TypeError):
+        # no libc, no inotify_init1 (not linux), or inotify limits hit
+        return PollingWatcher(paths)
+
+def wait_for_changes(watcher, debounce):
+    """
+    Blocks until some of the watched files change, then keeps collecting
+    changes until none came in for debounce seconds (editors and rsync like to
+    save in several steps). Returns the set of changed paths.
+    """
+    changed = set()
+    while len(changed) == 0:
+        changed = watcher.poll(60)
+    while True:
+        more = watcher.poll(debounce)
+        if len(more) == 0:
+            return changed
+        changed |= more
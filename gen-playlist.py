@@ -18,23 +18,73 @@
 # Optimize when # of events > 50000 and the script takes more than 1 sec.
 
 import lxml
+import argparse
+import array
+import bisect
+import concurrent.futures
+import contextlib
+import copy
 import csv
 import datetime, dateutil
+import hashlib
+import io
+import json
 import dateutil.tz as TZ
 import lxml.etree as ET
-import math
+import os
+import pickle
+import sys
+import time
+import tracemalloc
 from itertools import *
 from enum import Enum
 
+try:
+    import numpy as np
+except ImportError: # optional; makes the overlap and gap checks a lot faster
+    np = None
+
+import assetdb
+import filewatch
+import onair
+import playlistdiff
+import timecode
 
-## Some global constants
-researchr_fstring = "%Y/%m/%d %H:%M"
 
+## Some global constants
 base_output_file = "SPLASH21-playlist-demo-Zurich-" # FIXME remove demo for final
 base_room = "Swissotel Chicago | Zurich "
 
 room_ids = ["D", "B", "C"]
 
+INPUT_FILES = ["schedule.xml", "mapping.xml", "liveinfo.xml", "asset-info.csv"]
+CACHE_DIR = ".playlist-cache"
+ASSET_DB_FILE = os.path.join(CACHE_DIR, "assets.sqlite") # --asset-db without --asset-db-path
+
+
+def parse_researchr_time(date, time):
+    """
+    Parses a researchr "%Y/%m/%d" date and "%H:%M" time into seconds since the
+    epoch as read on a wall clock (i.e. not yet adjusted for the timezone).
+    """
+    year, month, day = date.split("/")
+    hour, minute = time.split(":")
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError(f"invalid researchr time {date} {time}")
+    # datetime.date does the range checking of the date for us
+    days = datetime.date(int(year), int(month), int(day)).toordinal() - timecode.EPOCH_ORDINAL
+    return days*86400 + hour*3600 + minute*60
+
+_interned = dict()
+def intern_names(names):
+    """
+    Tracks and badges come from a tiny vocabulary; share a single tuple of
+    interned strings between every timeslot that has the same ones.
+    """
+    names = tuple(sys.intern(name) for name in names)
+    return _interned.setdefault(names, names)
+
 
 class TimeSlotSchedule:
     """
@@ -58,61 +108,79 @@ class TimeSlotSchedule:
         <badge property="Event Form">Virtual</badge>
       </badges>
     </timeslot>
+
+    Nothing from the xml is kept around: start and end are integer epochs (the
+    aware datetimes are rebuilt on demand from the subevent's timezone) and
+    tracks/badges are shared interned tuples.
     """
-    def __init__(self, event_id, slot_id, title, room, start_ts, end_ts, is_mirror, badges, tracks, subevent, ts):
+    __slots__ = ("event_id", "slot_id", "title", "room", "start", "end",
+                 "is_mirror", "badges", "tracks", "subevent")
+
+    def __init__(self, event_id, slot_id, title, room, start, end, is_mirror, badges, tracks, subevent):
         self.event_id = event_id
         self.slot_id = slot_id
         self.title = title
         
         self.room = room
-        self.start_ts = start_ts
-        self.end_ts = end_ts
+        self.start = start
+        self.end = end
         self.subevent = subevent
         self.is_mirror = is_mirror
         
         self.badges = badges # in-person or virtual, keynote etc.
         self.tracks = tracks
-        self.ts = ts # pointer the timeslot xml node
 
     def __str__(self):
-        return f"Timeslot({self.title}, {self.tracks})"
+        return f"Timeslot({self.title}, {list(self.tracks)})"
+
+    def key(self):
+        """
+        Everything the scheduler can look at, as a plain tuple
+        """
+        return (self.event_id, self.slot_id, self.title, self.room, self.start, self.end,
+                self.is_mirror, self.badges, self.tracks)
+
+    @property
+    def start_ts(self):
+        return datetime.datetime.fromtimestamp(self.start, self.subevent.timezone)
+
+    @property
+    def end_ts(self):
+        return datetime.datetime.fromtimestamp(self.end, self.subevent.timezone)
 
     @classmethod
     def from_xml(cls, timezone, subevent, timeslot_xml):
         """
         Does validation and returns a TimeSlot Schedule
+        If timezone is None start and end are left as wall clock times (see localize)
         """
-        event_id = timeslot_xml.xpath(".//event_id/text()")[0]
-        slot_id = timeslot_xml.xpath(".//slot_id/text()")[0]
-        title = timeslot_xml.xpath(".//title/text()")[0]
-        room = timeslot_xml.xpath(".//room/text()")[0]
+        # direct child access; a timeslot is flat apart from persons/tracks/badges
+        event_id = timeslot_xml.findtext("event_id")
+        slot_id = timeslot_xml.findtext("slot_id")
+        title = timeslot_xml.findtext("title")
+        room = sys.intern(timeslot_xml.findtext("room"))
 
         #annoying date/time gubbins
-        start_date = timeslot_xml.xpath(".//date/text()")[0]
-        start_time = timeslot_xml.xpath(".//start_time/text()")[0]
-        end_date = timeslot_xml.xpath(".//end_date/text()")[0]
-        end_time = timeslot_xml.xpath(".//end_time/text()")[0]
-
-        is_mirror = False 
-        mirror_els = timeslot_xml.xpath("./@is_mirror")
-        if len(mirror_els) > 0:
-            is_mirror = mirror_els[0] == "true"
-
-        start_ts = datetime.datetime.strptime(f"{start_date} {start_time}", researchr_fstring).replace(tzinfo=timezone)
-        end_ts = datetime.datetime.strptime(f"{end_date} {end_time}", researchr_fstring).replace(tzinfo=timezone)
+        start = parse_researchr_time(timeslot_xml.findtext("date"), timeslot_xml.findtext("start_time"))
+        end = parse_researchr_time(timeslot_xml.findtext("end_date"), timeslot_xml.findtext("end_time"))
+        if timezone != None:
+            start = timecode.local_to_epoch(start, timezone)
+            end = timecode.local_to_epoch(end, timezone)
+
+        is_mirror = timeslot_xml.get("is_mirror") == "true"
         # description and persons elided; we don't need them for scheduling
 
         # track information
-        tracks = timeslot_xml.xpath(".//tracks/track/text()")
+        tracks = intern_names(track.text for track in timeslot_xml.iterfind("tracks/track"))
 
         # badges information
         # badges are annoying. Some of them have a "property" (really only the Event Form ones), while most don't
         # however, basically all of them have some semantic use. Keynotes, for example, are (sometimes) plenary, etc
         # for now we'll just shove them into an array without including the property data
         # ANI: Maybe we can have a class Badge to define that behaviour
-        badges = timeslot_xml.xpath(".//badges/badge/text()")
+        badges = intern_names(badge.text for badge in timeslot_xml.iterfind("badges/badge"))
 
-        return TimeSlotSchedule(event_id, slot_id, title, room, start_ts, end_ts, is_mirror, badges, tracks, subevent, timeslot_xml)
+        return TimeSlotSchedule(event_id, slot_id, title, room, start, end, is_mirror, badges, tracks, subevent)
 
 class SubeventSchedule:
     """
@@ -131,25 +199,151 @@ class SubeventSchedule:
     <timeslot/>....
     </subevent>
     """
-    def __init__(self, subevent_id, title, room, tracks, timeslots):
+    __slots__ = ("subevent_id", "title", "room", "tracks", "timeslots", "timezone")
+
+    def __init__(self, subevent_id, title, room, tracks, timeslots, timezone=None):
         self.subevent_id = subevent_id
         self.title = title
         self.room = room
         self.tracks = tracks
         self.timeslots = timeslots
+        self.timezone = timezone
+
+    def key(self):
+        """
+        Everything the scheduler can look at, as a plain tuple (timeslots included)
+        """
+        return (self.subevent_id, self.title, self.room, self.tracks, repr(self.timezone),
+                tuple(ts.key() for ts in self.timeslots))
+
+    def localize(self, timezone):
+        """
+        Moves timeslots parsed without a timezone onto real epochs
+        """
+        self.timezone = timezone
+        for ts in self.timeslots:
+            ts.start = timecode.local_to_epoch(ts.start, timezone)
+            ts.end = timecode.local_to_epoch(ts.end, timezone)
+
     @classmethod
-    def from_xml(cls, timezone, subevent_xml):
-        subevent_id = subevent_xml.xpath("./subevent_id/text()")[0]
-        title = subevent_xml.xpath("./title/text()")[0]
-        room = subevent_xml.xpath("./room/text()")[0]
-        tracks = subevent_xml.xpath("./tracks/track/text()")
-
-        ses = SubeventSchedule(subevent_id, title, room, tracks, [])
-        ses.timeslots = list(map(lambda el: TimeSlotSchedule.from_xml(timezone, ses, el), subevent_xml.xpath("./timeslot[event_id]")))
+    def from_xml(cls, timezone, subevent_xml, schedule_filter=None):
+        """
+        The subevent, or None if schedule_filter (a ScheduleFilter) doesn't want
+        it; that's decided before any of its timeslots are looked at
+        """
+        subevent_id = subevent_xml.findtext("subevent_id")
+        title = subevent_xml.findtext("title")
+        room = sys.intern(subevent_xml.findtext("room"))
+        tracks = intern_names(track.text for track in subevent_xml.iterfind("tracks/track"))
+        if schedule_filter != None and not schedule_filter.wants_subevent(room, tracks, subevent_xml.findtext("date")):
+            return None
+
+        ses = SubeventSchedule(subevent_id, title, room, tracks, [], timezone)
+        ses.timeslots = [TimeSlotSchedule.from_xml(timezone, ses, el)
+                         for el in subevent_xml.iterfind("timeslot")
+                         if el.find("event_id") is not None]
         return ses
 
+class ScheduleFilter:
+    """
+    The part of the schedule to generate: the subevents in rooms (all of them
+    if None) with a timeslot running at some point in [start, end) (either can
+    be None). Subevents of plenary_tracks are kept whatever their room, as
+    their plenary events show up in every room. start and end are datetimes;
+    naive ones are in the schedule's timezone.
+    load_schedule checks the rooms and the subevent's date while parsing, so
+    the subevents that can't be wanted (and all their timeslots) are never
+    built; the exact times are checked once the timezone is known.
+    """
+    def __init__(self, rooms=None, start=None, end=None, plenary_tracks=()):
+        self.rooms = rooms
+        self.start = start
+        self.end = end
+        self.plenary_tracks = set(plenary_tracks)
+        # the same bounds as wall clock seconds (see parse_researchr_time); a day
+        # wider for aware times, as no timezone is a day away from UTC
+        self.wall_start = self.wall_clock(start, -86400)
+        self.wall_end = self.wall_clock(end, 86400)
+
+    @staticmethod
+    def wall_clock(when, slack):
+        if when == None:
+            return None
+        if when.tzinfo == None:
+            return (when - timecode.EPOCH) // datetime.timedelta(seconds=1)
+        return int(when.timestamp()) + slack
+
+    def wants_subevent(self, room, tracks, date):
+        if self.rooms != None and not room in self.rooms and not any(t in self.plenary_tracks for t in tracks):
+            return False
+        if date == None:
+            return True
+        # timeslots can run past midnight, so the subevent gets two days
+        day = parse_researchr_time(date, "00:00")
+        return ((self.wall_end == None or day < self.wall_end)
+                and (self.wall_start == None or day + 2*86400 > self.wall_start))
+
+    def epoch(self, when, timezone):
+        if when.tzinfo == None:
+            return timecode.local_to_epoch(self.wall_clock(when, 0), timezone)
+        return int(when.timestamp())
+
+    def wants_times(self, subevent, timezone):
+        start = self.epoch(self.start, timezone) if self.start != None else None
+        end = self.epoch(self.end, timezone) if self.end != None else None
+        return any((start == None or ts.end > start) and (end == None or ts.start < end)
+                   for ts in subevent.timeslots)
+
+def load_schedule(schedule_file, schedule_filter=None):
+    """
+    Streams the researchr schedule and returns (timezone_id, subevents).
+    Only the top level <subevent>s (and the <timezone_id>) are looked at; every
+    top level element is cleared once it has been processed so the document is
+    never materialized as a whole.
+    researchr puts <timezone_id> at the very end, so timeslots are parsed
+    naive and localized once the whole file has been read.
+    With a schedule_filter, only the subevents it wants are returned.
+    """
+    timezone_id = None
+    subevents = []
+    top_level = ("event_details", "subevent", "timeslot", "timezone_id")
+    for _, el in ET.iterparse(schedule_file, events=("end",), tag=top_level):
+        parent = el.getparent()
+        if parent is None or parent.getparent() is not None:
+            continue # timeslots of a subevent are handled along with it
+        if el.tag == "subevent" and el.find("subevent_id") is not None:
+            se = SubeventSchedule.from_xml(None, el, schedule_filter)
+            if se != None:
+                subevents.append(se)
+        elif el.tag == "timezone_id":
+            timezone_id = el.text
+        el.clear()
+        while el.getprevious() is not None:
+            del parent[0]
+
+    if timezone_id == None:
+        raise RuntimeError(f"No timezone_id in {schedule_file}")
+    timezone = TZ.gettz(timezone_id)
+    for se in subevents:
+        se.localize(timezone)
+    if schedule_filter != None and (schedule_filter.start != None or schedule_filter.end != None):
+        subevents = [se for se in subevents if schedule_filter.wants_times(se, timezone)]
+    if profile != None:
+        profile.count("timeslots parsed", sum(len(se.timeslots) for se in subevents))
+    return timezone_id, subevents
+
 class ConferenceEvent:
-    pass
+    plenary = False # scheduled in every room by a plenary element
+
+    def copy(self):
+        """
+        Shallow copy, for changing an event that a cached schedule may still
+        hold on to (a good deal cheaper than copy.copy)
+        """
+        dup = object.__new__(type(self))
+        dup.__dict__.update(self.__dict__)
+        return dup
+
 class PrerecordedEvent(ConferenceEvent):
     def __init__(self, title, asset, start, duration, timeslot):
         self.title = title
@@ -192,13 +386,17 @@ class LiveEvent(ConferenceEvent):
         return f"Live({self.title}, {self.source}, {self.start} for {self.duration}, in {self.timeslot})"
 
 def parse_confpub(el):
-    confpub_id = el.xpath("./@id")[0]
+    confpub_id = el.get("id")
     return f"{confpub_id}-video"
 ASSET_TYPES = {
     "confpub": parse_confpub, 
     "missing": lambda el: None,
     "manual": lambda el: el.xpath("./@asset")[0]}
 
+# The sources an event plays (PrerecordedVideo, EventRoom, FillerStream, ZoomInfo)
+# all answer
+#   playlist_id()  (category, id element tag, id) in a playlist <event>
+#   onsite_id()    (element tag, text or None) in the chair <sources>
 class PrerecordedVideo:
     def __init__(self, asset_name, duration):
         self.asset_name = asset_name
@@ -207,47 +405,205 @@ class PrerecordedVideo:
     def __str__(self) -> str:
         return f"Prerecord({self.asset_name} for {self.duration})"
     
-    def to_playlist_xml(self):
-        mediaid = ET.Element("mediaid")
-        mediaid.text = self.asset_name
-        return "PROGRAM", mediaid
+    def playlist_id(self):
+        return "PROGRAM", "mediaid", self.asset_name
     
-    def to_onsite_xml(self):
-        media = ET.Element("asset")
-        media.text = self.asset_name
-        return media
+    def onsite_id(self):
+        return "asset", self.asset_name
+
+def parse_asset_duration(text):
+    """
+    "H:MM:SS.ff" (asset-info.csv's Duration) => integer microseconds, with plain integer arithmetic
+    """
+    hms, _, fraction = text.partition('.')
+    hours, minutes, seconds = hms.split(':')
+    return (((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * 1000000
+            + int((fraction + "000000")[:6]))
+
+def read_asset_info(asset_info, start=0):
+    """
+    Yields (asset name, duration in microseconds) for the rows of
+    asset-info.csv, only the ones from byte offset start on (the start of a
+    row) if it isn't 0
+    """
+    with open(asset_info, "rb") as f:
+        header = f.readline()
+        if start > 0:
+            f.seek(start)
+        rows = io.TextIOWrapper(f, newline='')
+        header = next(csv.reader([header.decode(rows.encoding)]))
+        name_col, duration_col = header.index("Name"), header.index("Duration")
+        for row in csv.reader(rows):
+            if len(row) > 0:
+                yield row[name_col], parse_asset_duration(row[duration_col])
+
+def read_mapping(mapping_file, start=0):
+    """
+    Yields (event id, asset name or None) for the matches of mapping.xml
+    (start is there to look like read_asset_info; xml is always read whole)
+    """
+    for _, match in ET.iterparse(mapping_file, tag="match"):
+        source = match[0]
+        yield match.get("event_id"), ASSET_TYPES[source.tag](source)
+        match.clear()
+
+class PackedKeys:
+    """
+    A sorted set of strings packed into one string plus an array of offsets.
+    Pickles and unpickles in next to no time (no per key objects) and finds
+    keys by binary search.
+    """
+    def __init__(self, text, offsets):
+        self.text = text
+        self.offsets = offsets
 
     @classmethod
-    def from_xml(cls, elem, duration_mappings):
-        source = list(elem)[0]
-        asset_name = ASSET_TYPES[source.tag](source)
-        duration = None
-        if asset_name in duration_mappings:
-            duration = duration_mappings[asset_name]
-        return cls(asset_name, duration)
+    def from_keys(cls, keys):
+        keys = sorted(keys)
+        offsets = array.array('q', [0])
+        for key in keys:
+            offsets.append(offsets[-1] + len(key))
+        return cls("".join(keys), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def key(self, i):
+        return self.text[self.offsets[i]:self.offsets[i+1]]
+
+    def find(self, key):
+        """
+        The position of key, -1 if it isn't there
+        """
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self) and self.key(lo) == key:
+            return lo
+        return -1
+
+class AssetCatalog:
+    """
+    The parts of mapping.xml and asset-info.csv the scheduler needs, packed:
+    the asset names with their durations (integer microseconds, -1 when
+    asset-info.csv doesn't have the asset) and the event ids with the number
+    of their asset (-1 for events marked missing).
+    Persisted to an index file and reused for as long as both files keep the
+    same contents.
+    """
+    VERSION = 1
+
+    def __init__(self, names, durations, event_ids, event_assets):
+        self.names = names
+        self.durations = durations
+        self.event_ids = event_ids
+        self.event_assets = event_assets
+
+    @classmethod
+    def from_dicts(cls, durations, assets):
+        """
+        durations: asset name => duration in microseconds, assets: event id => asset name or None
+        """
+        names = sorted(set(durations) | set(a for a in assets.values() if a != None))
+        position = {name: i for i, name in enumerate(names)}
+        event_ids = sorted(assets)
+        return cls(PackedKeys.from_keys(names),
+                   array.array('q', (durations.get(name, -1) for name in names)),
+                   PackedKeys.from_keys(event_ids),
+                   array.array('q', (-1 if assets[e] == None else position[assets[e]] for e in event_ids)))
+
+    def packed(self):
+        """
+        The catalog as plain strings and arrays, for pickling
+        """
+        return (self.names.text, self.names.offsets, self.durations,
+                self.event_ids.text, self.event_ids.offsets, self.event_assets)
+
+    @classmethod
+    def from_packed(cls, packed):
+        names, name_offsets, durations, event_ids, event_offsets, event_assets = packed
+        return cls(PackedKeys(names, name_offsets), durations, PackedKeys(event_ids, event_offsets), event_assets)
+
+    @classmethod
+    def from_files(cls, mapping_file, asset_info):
+        return cls.from_dicts(dict(read_asset_info(asset_info)), dict(read_mapping(mapping_file)))
+
+    @classmethod
+    def load(cls, mapping_file, asset_info, index_path=None):
+        """
+        Reads the catalog from index_path if it was made from the current
+        mapping_file and asset_info, from the files otherwise (and then
+        writes index_path). The index is an InputSnapshot with the catalog
+        packed as its only part.
+        """
+        index = InputSnapshot(index_path, version=cls.VERSION)
+        packed = index.get("catalog", [mapping_file, asset_info],
+                           lambda: cls.from_files(mapping_file, asset_info).packed())
+        try:
+            index.save()
+        except OSError as e:
+            print(f"couldn't write the asset index {index_path}: {e}")
+        return cls.from_packed(packed)
+
+    def has_event(self, event_id):
+        return self.event_ids.find(event_id) >= 0
+
+    def event_asset(self, event_id):
+        """
+        (asset name, duration in microseconds or None) of a mapped event
+        """
+        i = self.event_ids.find(event_id)
+        if i < 0:
+            raise KeyError(event_id)
+        asset = self.event_assets[i]
+        if asset < 0:
+            return None, None
+        duration = self.durations[asset]
+        return self.names.key(asset), (duration if duration >= 0 else None)
 
 class VideoMapping:
-    def __init__(self, event_map):
-        self.event_map = event_map
+    """
+    event id => PrerecordedVideo, made the first time an event is asked for
+    """
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.videos = dict()
     def has_event(self, event_id):
-        return event_id in self.event_map
+        return self.catalog.has_event(event_id)
     def get_event(self, event_id):
-        return self.event_map[event_id]
+        video = self.videos.get(event_id)
+        if video == None:
+            asset_name, duration = self.catalog.event_asset(event_id)
+            if duration != None:
+                duration = datetime.timedelta(microseconds=duration)
+            video = PrerecordedVideo(asset_name, duration)
+            self.videos[event_id] = video
+        return video
+    def event_key(self, event_id):
+        if not self.has_event(event_id):
+            return None
+        return self.catalog.event_asset(event_id)
 
     @classmethod
-    def from_files(cls, mapping_file, asset_info):
-        duration_mappings = dict()
-        with open(asset_info) as csvfile:
-            reader = csv.DictReader(csvfile)
-            fmt = "%H:%M:%S.%f"
-            for row in reader:
-                dt = datetime.datetime.strptime(row["Duration"], fmt)
-                duration_mappings[row["Name"]] = \
-                    datetime.timedelta(hours=dt.hour, minutes=dt.minute, 
-                                       seconds=dt.second, microseconds=dt.microsecond)
-        mapping_xml = ET.parse(mapping_file)
-        event_mappings = dict(map(lambda el: (el.xpath("./@event_id")[0], PrerecordedVideo.from_xml(el, duration_mappings)), mapping_xml.getroot()))
-        return VideoMapping(event_mappings)
+    def from_files(cls, mapping_file, asset_info, index_path=None):
+        return VideoMapping(AssetCatalog.load(mapping_file, asset_info, index_path))
+
+    @classmethod
+    def from_db(cls, db_path, mapping_file, asset_info):
+        """
+        Goes through the SQLite catalog at db_path (see assetdb.py) instead,
+        after importing whatever changed in mapping_file and asset_info
+        """
+        db = assetdb.AssetDB(db_path)
+        assets = db.import_file(asset_info, "assets", read_asset_info, appendable=True)
+        matches = db.import_file(mapping_file, "mappings", read_mapping)
+        if assets > 0 or matches > 0:
+            print(f"imported {assets} assets and {matches} mappings into {db_path}")
+        return VideoMapping(db)
 
 class EventRoom:
     def __init__(self, name, live_stream, filler_stream):
@@ -258,14 +614,11 @@ class EventRoom:
     def remote_stream(self):
         return self.live
 
-    def to_playlist_xml(self):
-        mediaid = ET.Element("liveid")
-        mediaid.text = self.live
-        return "LIVE", mediaid
+    def playlist_id(self):
+        return "LIVE", "liveid", self.live
 
-    def to_onsite_xml(self):
-        media = ET.Element("room")
-        return media
+    def onsite_id(self):
+        return "room", None
 
     @classmethod
     def from_xml(cls, elem):
@@ -276,14 +629,11 @@ class FillerStream:
     def __init__(self, stream):
         self.stream = stream
 
-    def to_playlist_xml(self):
-        mediaid = ET.Element("liveid")
-        mediaid.text = self.stream
-        return "LIVE", mediaid
+    def playlist_id(self):
+        return "LIVE", "liveid", self.stream
         
-    def to_onsite_xml(self):
-        media = ET.Element("filler")
-        return media
+    def onsite_id(self):
+        return "filler", None
 
     @classmethod
     def from_xml(cls, elem):
@@ -297,15 +647,11 @@ class ZoomInfo:
     def remote_stream(self):
         return self.stream 
     
-    def to_playlist_xml(self):
-        mediaid = ET.Element("liveid")
-        mediaid.text = self.stream
-        return "LIVE", mediaid
+    def playlist_id(self):
+        return "LIVE", "liveid", self.stream
     
-    def to_onsite_xml(self):
-        media = ET.Element("zoom")
-        media.text = self.url
-        return media
+    def onsite_id(self):
+        return "zoom", self.url
 
     @classmethod
     def from_xml(cls, elem):
@@ -329,11 +675,7 @@ class ScheduleElement:
     def schedule(self, mapping, rooms, spec, format, timeslot, now):
         out = dict()
         if self.plenary:
-            first = True
-            for room in rooms:
-                out_evt, new_now = self.schedule_one(mapping, room, spec, format, timeslot, now, first=first)
-                out[room.name] = out_evt
-                first = False
+            out, new_now = self.schedule_plenary(mapping, rooms, spec, format, timeslot, now)
         else: 
             for room in rooms:
                 previous_now = None
@@ -346,6 +688,20 @@ class ScheduleElement:
                         previous_now = new_now
         return out, new_now
 
+    def schedule_plenary(self, mapping, rooms, spec, format, timeslot, now):
+        """
+        Schedules the element in every room; only the first room records
+        """
+        out = dict()
+        first = True
+        for room in rooms:
+            out_evt, new_now = self.schedule_one(mapping, room, spec, format, timeslot, now, first=first)
+            for evt in out_evt:
+                evt.plenary = True
+            out[room.name] = out_evt
+            first = False
+        return out, new_now
+
 class PrerecordedElement(ScheduleElement):
     def __init__(self, source, plenary=False, backup=None):
         self.source = source
@@ -371,6 +727,8 @@ class PrerecordedElement(ScheduleElement):
                 if duration != None and duration > (timeslot.end_ts - now):
                     duration = (timeslot.end_ts - now)
                 elif duration == None and self.backup != None:
+                    if profile != None:
+                        profile.count("backups triggered")
                     output = []
                     for backup in self.backup:
                         evts,now = backup.schedule(mapping, [room], spec, format, timeslot, now)
@@ -386,6 +744,28 @@ class PrerecordedElement(ScheduleElement):
 
         return [PrerecordedEvent(timeslot.title, asset, onairtime, duration, timeslot)], now+duration
 
+    def needs_backup(self, mapping, timeslot):
+        """
+        Whether schedule_one hands timeslot over to the backups (a mapped video of unknown duration)
+        """
+        if self.backup == None or self.source != None or not mapping.has_event(timeslot.event_id):
+            return False
+        asset_data = mapping.get_event(timeslot.event_id)
+        return asset_data.asset_name != None and asset_data.duration == None
+
+    def schedule_plenary(self, mapping, rooms, spec, format, timeslot, now):
+        """
+        A prerecording plays the same in every room, so it is scheduled once
+        and the very same events go in every room. Backups depend on the room,
+        those are scheduled room by room.
+        """
+        if len(rooms) == 0 or self.needs_backup(mapping, timeslot):
+            return super().schedule_plenary(mapping, rooms, spec, format, timeslot, now)
+        out_evt, new_now = self.schedule_one(mapping, rooms[0], spec, format, timeslot, now)
+        for evt in out_evt:
+            evt.plenary = True
+        return {room.name: out_evt for room in rooms}, new_now
+
     @classmethod
     def from_xml(cls, elem):
         asset = None
@@ -410,24 +790,49 @@ class PrerecordedElement(ScheduleElement):
 
 
 class LiveElement(ScheduleElement): 
-    def __init__(self, source, plenary=False, recording=None, xml_elem=None):
+    def __init__(self, source, plenary=False, recording=None, sourceline=None):
         self.source = source
         self.plenary = plenary
         self.recording = recording
-        self.xml_elem = xml_elem
+        self.sourceline = sourceline # of the element in liveinfo.xml; the element itself isn't kept (or picklable)
 
     def schedule_one(self, mapping, rooms, spec, format, timeslot:TimeSlotSchedule, now, first=True):
         ctx_dict = self.make_context_dict(rooms, spec, format, timeslot)
         try: 
             source = ctx_dict[self.source]
         except ValueError:
-            print(f"invalid format string {self.source} in element on line {self.xml_elem.sourceline}")
+            print(f"invalid format string {self.source} in element on line {self.sourceline}")
             raise 
         duration = timeslot.end_ts - now
         onairtime = now
         ts = timeslot
         return [LiveEvent(f"Live: {timeslot.title}", source, onairtime, duration, timeslot, recording=self.recording.format(**ctx_dict) if self.recording != None and first else None)], now+duration
 
+    def schedule_plenary(self, mapping, rooms, spec, format, timeslot, now):
+        """
+        Only the source differs from room to room (and only the first room
+        records), so the rest is worked out once and shared by the events of
+        every room
+        """
+        out = dict()
+        title = f"Live: {timeslot.title}"
+        duration = timeslot.end_ts - now
+        recording = None
+        for room in rooms:
+            ctx_dict = self.make_context_dict(room, spec, format, timeslot)
+            try: 
+                source = ctx_dict[self.source]
+            except ValueError:
+                print(f"invalid format string {self.source} in element on line {self.sourceline}")
+                raise 
+            if self.recording != None and len(out) == 0:
+                recording = self.recording.format(**ctx_dict)
+            evt = LiveEvent(title, source, now, duration, timeslot, recording=recording)
+            evt.plenary = True
+            out[room.name] = [evt]
+            recording = None
+        return out, now+duration
+
     @classmethod
     def from_xml(cls, elem):
         source = elem.xpath('./@source')
@@ -443,7 +848,7 @@ class LiveElement(ScheduleElement):
         else:
             recordName = None
 
-        return cls(source[0], plenary=is_plenary, recording=recordName, xml_elem=elem)
+        return cls(source[0], plenary=is_plenary, recording=recordName, sourceline=elem.sourceline)
 
 class NotStreamedElement(ScheduleElement):
     def __init__(self):
@@ -458,21 +863,39 @@ class NotStreamedElement(ScheduleElement):
 SCHEDULE_ELEMENT_TYPES = dict(prerecorded=PrerecordedElement, live=LiveElement, notstreamed=NotStreamedElement)
 
 class EventFormat:
-    def __init__(self, cond, schedule, name=""):
-        self.cond = cond
+    """
+    A <format> of an event in liveinfo.xml. The attributes on the element
+    (name, mirror, badge, event_id, slot_id, subevent_id) are all conditions on
+    the timeslot that have to hold for the format to apply.
+    """
+    def __init__(self, conditions, schedule, name=""):
+        self.conditions = conditions # condition attribute => required value
         self.schedules = schedule
         self.name = name
 
+    def matches(self, ts):
+        for cond, req in self.conditions.items():
+            if cond == "name":
+                ok = ts.title == req
+            elif cond == "mirror":
+                ok = ts.is_mirror == req
+            elif cond == "badge":
+                ok = req in ts.badges
+            elif cond == "subevent_id":
+                ok = ts.subevent.subevent_id == req
+            else:
+                ok = getattr(ts, cond) == req
+            if not ok:
+                return False
+        return True
+
     # attempts to schedule the given timeslot with the given spec
     # if successful, returns a dict of room=>schedule elements. 
     # if did not match precondition, returns None.
     def schedule(self, scheduler, mapping, rooms, spec, timeslot):
-        if not self.cond(scheduler, timeslot):
+        if not self.matches(timeslot):
             return None
 
-        if (timeslot.event_id == "a2bd814e-644b-4386-a2fe-63fc670a4c7d"):
-            print(f"here {self.name} {self.schedules}")
-
         scheduled = dict()
         now = timeslot.start_ts
         for schedule_elem in self.schedules:
@@ -489,53 +912,11 @@ class EventFormat:
         # condition parsing
         # =================
         # by default we always apply
-        cond = lambda sch, ts: True 
-        #helper for attribute parsing
-        def prop_cond(prop_xpath, if_cond, acc):
-            elems = elem.xpath(prop_xpath)
-            if len(elems) > 0:
-                return if_cond(acc, elems[0])
-            return acc
-        # name condition
-        cond = prop_cond("./@name", lambda cond, name: lambda sch, ts: ts.title == name and cond(sch, ts), cond)
-
-        def is_mirror(scheduler, ts, mirrored):
-            is_mirror = scheduler.is_mirror(ts)
-            return scheduler.is_mirror(ts) and mirrored
-        # mirror condition
-        cond = prop_cond("./@mirror", lambda cond, mirrored: lambda sch, ts: (ts.is_mirror == (mirrored == "true")) and cond(sch, ts), cond)
-
-        # badges condition
-        badge_cond = elem.xpath("./@badge")
-        if len(badge_cond) > 0:
-            badge_req = badge_cond[0]
-            old_cond = cond
-            cond = lambda sch, ts: badge_req in ts.badges and old_cond(sch, ts)
-
-        # explicit event_id condition (last minute stuff)
-        event_id_cond = elem.xpath("./@event_id")
-        if len(event_id_cond) >0:
-            event_id_req = event_id_cond[0]
-            old_cond = cond
-            cond = lambda sch, ts: event_id_req == ts.event_id and old_cond(sch, ts)
-
-        # explicit slot_id condition (last minute stuff)
-        slot_id_cond = elem.xpath("./@slot_id")
-        if len(slot_id_cond) >0:
-            slot_id_req = slot_id_cond[0]
-            old_cond = cond
-            cond = lambda sch, ts: slot_id_req == ts.slot_id and old_cond(sch, ts)
-            
-        subevent_id_cond = elem.xpath("./@subevent_id")
-        if len(subevent_id_cond) > 0:
-            subevent_id_req = subevent_id_cond[0]
-            old_cond = cond
-            def new_cond(sch,ts):
-                res_a = subevent_id_req == ts.subevent.subevent_id
-                res_b = old_cond(sch, ts)
-                print(f"applies to {ts.event_id}? {res_a} and {res_b}")
-                return res_a and res_b
-            cond = new_cond
+        conditions = dict()
+        for cond in FORMAT_CONDITIONS:
+            req = elem.get(cond)
+            if req != None:
+                conditions[cond] = req == "true" if cond == "mirror" else req
 
         # ====================
         # event format parsing
@@ -553,55 +934,130 @@ class EventFormat:
         if len(name_els) > 0:
             name = name_els[0]
 
-        return EventFormat(cond, schedule_elems, name=name)
+        return EventFormat(conditions, schedule_elems, name=name)
 
+# the conditions a format can have, most selective first. 
+# name is matched against the timeslot title and last minute stuff goes by the ids.
+FORMAT_CONDITIONS = ("event_id", "slot_id", "subevent_id", "name", "badge", "mirror")
 
-def merge_schedule_dicts(d1, d2):
-    out = dict()
-    for k1 in d1.keys():
-        out[k1] = []
-    for k2 in d2.keys():
-        out[k2] = []
-    for k1, v1 in d1.items():
-        out[k1].extend(v1)
-    for k2, v2 in d2.items():
-        out[k2].extend(v2)
-    return out
+class FormatIndex:
+    """
+    Dispatch index over the formats of an EventSpec.
+    Each format is filed under its most selective condition (hash maps keyed by
+    the required value); formats without any condition go in the fallback list.
+    A timeslot then only has to check the handful of formats whose key it hits,
+    in their original order, so the first matching format still wins.
+    """
+    def __init__(self, formats, name=""):
+        self.formats = formats
+        self.name = name # of the EventSpec, for profiling
+        self.index = {cond: dict() for cond in FORMAT_CONDITIONS}
+        self.fallback = []
+        for position, format in enumerate(formats):
+            for cond in FORMAT_CONDITIONS:
+                if cond in format.conditions:
+                    self.index[cond].setdefault(format.conditions[cond], []).append(position)
+                    break
+            else:
+                self.fallback.append(position)
+
+    def candidates(self, ts):
+        index = self.index
+        found = list(self.fallback)
+        found.extend(index["event_id"].get(ts.event_id, ()))
+        found.extend(index["slot_id"].get(ts.slot_id, ()))
+        found.extend(index["subevent_id"].get(ts.subevent.subevent_id, ()))
+        found.extend(index["name"].get(ts.title, ()))
+        found.extend(index["mirror"].get(ts.is_mirror, ()))
+        for badge in ts.badges:
+            found.extend(index["badge"].get(badge, ()))
+        found.sort()
+        return found
+
+    def lookup(self, ts):
+        """
+        Returns the first format (in liveinfo.xml order) that applies to ts, or None.
+        """
+        formats = self.formats
+        candidates = self.candidates(ts)
+        for attempt, position in enumerate(candidates):
+            if formats[position].matches(ts):
+                if profile != None:
+                    profile.count_format_matches(self.name, attempt + 1)
+                return formats[position]
+        if profile != None:
+            profile.count_format_matches(self.name, len(candidates))
+        return None
+
+
+class RoomTimeline:
+    """
+    Accumulates scheduled events per room, keeping each room in start order.
+    Events are appended in place (bisecting only when one lands before the end)
+    so nobody has to re-sort or copy the schedule as it grows.
+    Equal starts keep the order they were added in, like a stable sort would.
+    """
+    def __init__(self):
+        self.events = dict() # room => [evt] ordered by start
+        self.starts = dict() # room => [evt.start] at the time it was added
+
+    def add(self, room, evts):
+        events = self.events.setdefault(room, [])
+        starts = self.starts.setdefault(room, [])
+        for evt in evts:
+            if len(starts) == 0 or starts[-1] <= evt.start:
+                events.append(evt)
+                starts.append(evt.start)
+            else:
+                pos = bisect.bisect_right(starts, evt.start)
+                events.insert(pos, evt)
+                starts.insert(pos, evt.start)
+
+    def merge(self, other):
+        for room, evts in other.items():
+            self.add(room, evts)
+
+    def items(self):
+        return self.events.items()
+
+    def __getitem__(self, room):
+        return self.events[room]
 
 class EventSpec:
     def __init__(self, name, formats):
         self.name = name
         self.formats = formats
+        self.format_index = FormatIndex(formats, name)
         self.compact_recorded = False
+        self.fingerprint = name # hash of the <event> element when read from liveinfo.xml
 
     def schedule(self, scheduler, mapping, rooms, subevent):
-        schedule = dict()
-        # TODO: compaction will break excitingly in the case of plenaries. Don't combine them.
+        """
+        The subevent's events per room, as laid out by the formats; compaction
+        happens later, over whole rooms (see compact_rooms)
+        """
+        schedule = RoomTimeline()
         for ts in subevent.timeslots:
-            schedule = merge_schedule_dicts(schedule, self.schedule_timeslot(scheduler, mapping, rooms, ts))
-        if self.compact_recorded:
-            for room, evts in schedule.items():
-                now = None
-                evts.sort(key=lambda evt: evt.start)
-                evt = None
-                offset = datetime.timedelta()
-                for evt in evts:
-                    if now != None:
-                        offset = evt.start - now 
-                        evt.start = now
-                        offset -= evt.offer_time(offset)
-                        now = now + evt.duration
-                    else:
-                        now = evt.start + evt.duration
-                if evt != None:
-                    evt.duration += offset
+            for room, evts in self.schedule_timeslot(scheduler, mapping, rooms, ts).items():
+                schedule.add(room, evts)
         return schedule
 
+    def has_plenary(self):
+        """
+        Whether some format (or backup) schedules plenary events
+        """
+        elems = [elem for format in self.formats for elem in format.schedules]
+        while len(elems) > 0:
+            elem = elems.pop()
+            if getattr(elem, "plenary", False):
+                return True
+            elems.extend(getattr(elem, "backup", None) or [])
+        return False
+
     def schedule_timeslot(self, scheduler, mapping, rooms, timeslot):
-        for format in self.formats:
-            result = format.schedule(scheduler, mapping, rooms, self, timeslot)
-            if result != None:
-                return result
+        format = self.format_index.lookup(timeslot)
+        if format != None:
+            return format.schedule(scheduler, mapping, rooms, self, timeslot)
         raise RuntimeError(f"Failure to schedule timeslot {timeslot.event_id}; formatters: {self.formats}!")
     def has_zoom(self):
         return hasattr(self, 'zoom')
@@ -617,6 +1073,7 @@ class EventSpec:
     def from_xml(cls, elem):
         formats = list(map(EventFormat.from_xml, elem.xpath("./format")))
         out = cls(elem.xpath("./@name")[0], formats)
+        out.fingerprint = hashlib.sha256(ET.tostring(elem)).hexdigest()
         zoom_elems = elem.xpath("./zoom")
         if len(zoom_elems) > 0:
             out.zoom = [ZoomInfo.from_xml(zoom_elem) for zoom_elem in zoom_elems]
@@ -641,15 +1098,37 @@ class Scheduler:
                 raise RuntimeError(f"Repeated definition of event ${event_spec.name}!")
 
 
-    def schedule(self, mapping, subevent):
-        scheduler = None
+    def event_spec(self, subevent):
         for track in subevent.tracks:
             if track in self.events_map:
-                scheduler = self.events_map[track]
-                break
-        if scheduler == None:
-            raise RuntimeError(f"Was unable to find a scheduler for event {subevent.subevent_id} in tracks {subevent.tracks}!")
-        return scheduler.schedule(self, mapping, self.rooms, subevent)
+                return self.events_map[track]
+        raise RuntimeError(f"Was unable to find a scheduler for event {subevent.subevent_id} in tracks {subevent.tracks}!")
+
+    def plenary_tracks(self):
+        """
+        Names of the events (tracks) whose subevents can put events in every room
+        """
+        return [event_spec.name for event_spec in self.events if event_spec.has_plenary()]
+
+    def schedule(self, mapping, subevent):
+        event_spec = self.event_spec(subevent)
+        if profile == None:
+            return event_spec.schedule(self, mapping, self.rooms, subevent)
+        start = time.perf_counter()
+        scheduled = event_spec.schedule(self, mapping, self.rooms, subevent)
+        profile.time_spec(event_spec.name, time.perf_counter() - start)
+        return scheduled
+
+    def fingerprint(self, mapping, subevent):
+        """
+        Hash of everything that goes into scheduling subevent: the subevent and
+        its timeslots, their mapping entries and asset durations, the EventSpec
+        that governs it and the rooms it can be scheduled in.
+        """
+        rooms = tuple((room.name, room.live, room.filler) for room in self.rooms)
+        key = (rooms, self.event_spec(subevent).fingerprint, subevent.key(),
+               tuple(mapping.event_key(ts.event_id) for ts in subevent.timeslots))
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
 
     @classmethod
     def from_xml(cls, elem):
@@ -666,6 +1145,293 @@ class Scheduler:
         events = list(map(EventSpec.from_xml, elem.xpath(".//events/event")))
         return cls(rooms, events, main_start, main_end)
 
+    @classmethod
+    def from_file(cls, liveinfo_file):
+        parser = ET.XMLParser(remove_comments=True)
+        return cls.from_xml(ET.parse(liveinfo_file, parser = parser))
+
+
+class ScheduleCache:
+    """
+    Scheduling results from previous runs, keyed by the fingerprint of each
+    subevent's inputs (see Scheduler.fingerprint). Subevents whose fingerprint
+    is in the cache reuse the stored RoomTimeline; only the others go through
+    Scheduler.schedule. Results from a different version of this script are
+    thrown away. Without a path the cache only lives in memory.
+    Reused events are pointed back at this run's timeslots and timezone (see
+    reattach), so they can't be told apart from freshly scheduled ones.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = dict() # fingerprint => RoomTimeline
+        self.used = dict() # in the order they were used
+        self.rescheduled = 0
+        if path != None:
+            self.entries = read_pickle(path, code_version(), self.entries)
+
+    def schedule(self, scheduler, mapping, subevent):
+        fingerprint = scheduler.fingerprint(mapping, subevent)
+        scheduled = self.entries.get(fingerprint)
+        if scheduled == None:
+            scheduled = scheduler.schedule(mapping, subevent)
+            self.rescheduled += 1
+        else:
+            self.reattach(scheduled, subevent)
+        self.used[fingerprint] = scheduled
+        return scheduled
+
+    @staticmethod
+    def reattach(scheduled, subevent):
+        """
+        Unpickled timelines come with their own copies of the subevent, its
+        timeslots and its tzinfo. Their events are moved over to subevent's
+        (the fingerprint matched, so they have the same keys), as datetimes
+        with different tzinfo objects subtract in absolute rather than wall
+        clock time.
+        """
+        timeslots = None
+        for _, evts in scheduled.items():
+            for evt in evts:
+                if evt.timeslot.subevent is subevent:
+                    continue # already this run's (or a plenary event seen in another room)
+                if timeslots == None:
+                    timeslots = {ts.key(): ts for ts in subevent.timeslots}
+                evt.timeslot = timeslots[evt.timeslot.key()]
+                evt.start = evt.start.astimezone(subevent.timezone)
+
+    def start_run(self):
+        """
+        For long running processes: keeps only what the last run used
+        """
+        if len(self.used) > 0:
+            self.entries = self.used
+        self.used = dict()
+        self.rescheduled = 0
+
+    def save(self, partial=False):
+        """
+        Writes out the results used in this run (and only those, unless the
+        run only covered part of the schedule)
+        """
+        entries = self.used
+        if partial:
+            entries = dict(self.entries)
+            entries.update(self.used)
+        write_pickle(self.path, code_version(), entries)
+
+def read_pickle(path, version, default):
+    """
+    What write_pickle wrote to path, or default if it's missing, unreadable
+    or from another version
+    """
+    try:
+        with open(path, "rb") as f:
+            written_version, value = pickle.load(f)
+        if written_version == version:
+            return value
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+        pass # missing or unreadable; start from scratch
+    return default
+
+def write_pickle(path, version, value):
+    """
+    Pickles (version, value) to path through a temporary file, so readers
+    never see half of it
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump((version, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+class InputSnapshot:
+    """
+    The parsed and normalized inputs of previous runs, kept in a single pickle
+    so a warm start is one bulk read. Each part is stored with a stamp (size,
+    mtime and content hash) of every file it was built from, and is rebuilt
+    as soon as one of them changed. As with ScheduleCache, snapshots from a
+    different version (of this script, unless another one is given) are
+    thrown away, and without a path the snapshot only lives in memory.
+    """
+    def __init__(self, path=None, version=None):
+        self.path = path
+        self.version = version if version != None else code_version()
+        self.parts = dict() # name => (stamps, value)
+        self.changed = False
+        if path != None:
+            self.parts = read_pickle(path, self.version, self.parts)
+
+    def get(self, name, files, build):
+        """
+        Returns the part called name, calling build() if it is missing or any of files changed
+        """
+        if name in self.parts:
+            stamps, value = self.parts[name]
+            fresh = [refresh_stamp(stamp) for stamp in stamps]
+            if [stamp[0] for stamp in stamps] == files and not None in fresh:
+                if fresh != stamps:
+                    # touched but not changed
+                    self.parts[name] = (fresh, value)
+                    self.changed = True
+                return value
+        stamps = [file_stamp(f) for f in files] # before building, so we never miss an edit
+        value = build()
+        self.parts[name] = (stamps, value)
+        self.changed = True
+        return value
+
+    def save(self):
+        if not self.changed or self.path == None:
+            return
+        write_pickle(self.path, self.version, self.parts)
+        self.changed = False
+
+def file_stamp(path, stat=None):
+    if stat == None:
+        stat = os.stat(path)
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return (path, stat.st_size, stat.st_mtime_ns, digest)
+
+def refresh_stamp(stamp):
+    """
+    Returns an up to date stamp if the file still has the same contents, None if it changed.
+    Size and mtime are trusted when they match; otherwise the contents are rehashed.
+    """
+    path, size, mtime, digest = stamp
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if stat.st_size != size:
+        return None
+    if stat.st_mtime_ns == mtime:
+        return stamp
+    fresh = file_stamp(path, stat)
+    return fresh if fresh[3] == digest else None
+
+class RunProfile:
+    """
+    What --profile collects: the time spent in each stage (stages can nest;
+    an outer stage's time and peak memory include its inner stages'), the
+    peak memory tracemalloc saw in each stage and overall, and counters bumped from the hot paths (which check for
+    a profile first, so without --profile they cost next to nothing).
+    With a cprofile_path, the scheduling stage also runs under cProfile and
+    its stats are dumped there.
+    """
+    def __init__(self, cprofile_path=None):
+        self.seconds = dict()
+        self.peak_memory = dict()
+        self.counters = dict()
+        self.format_matches = dict() # EventSpec name => formats tried
+        self.spec_seconds = dict() # EventSpec name => time spent scheduling its subevents
+        self.cprofile_path = cprofile_path
+        self.cprofiler = None
+        self.open_peaks = [] # peak memory so far of each stage we're in, outermost first
+
+    def start(self):
+        tracemalloc.start()
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # the traced peak is reset for this stage, so the enclosing one keeps what it saw so far
+        if len(self.open_peaks) > 0:
+            self.open_peaks[-1] = max(self.open_peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self.open_peaks.append(0)
+        if name == "scheduling" and self.cprofile_path != None:
+            import cProfile
+            self.cprofiler = cProfile.Profile()
+            self.cprofiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0) + time.perf_counter() - start
+            if name == "scheduling" and self.cprofiler != None:
+                self.cprofiler.disable()
+                self.cprofiler.dump_stats(self.cprofile_path)
+                self.cprofiler = None
+            peak = max(self.open_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            self.peak_memory[name] = max(self.peak_memory.get(name, 0), peak)
+            if len(self.open_peaks) > 0:
+                self.open_peaks[-1] = max(self.open_peaks[-1], peak)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def count_format_matches(self, spec_name, attempts):
+        self.format_matches[spec_name] = self.format_matches.get(spec_name, 0) + attempts
+
+    def time_spec(self, spec_name, seconds):
+        self.spec_seconds[spec_name] = self.spec_seconds.get(spec_name, 0) + seconds
+
+    def report(self):
+        _, peak = tracemalloc.get_traced_memory()
+        return { "total_seconds": round(time.perf_counter() - self.started, 6)
+               , "stage_seconds": {name: round(s, 6) for name, s in self.seconds.items()}
+               , "stage_peak_memory_bytes": self.peak_memory
+               , "peak_memory_bytes": max([peak] + list(self.peak_memory.values()))
+               , "counters": self.counters
+               , "format_match_attempts": dict(sorted(self.format_matches.items(), key=lambda kv: -kv[1]))
+               , "event_spec_seconds": {name: round(s, 6) for name, s in
+                                        sorted(self.spec_seconds.items(), key=lambda kv: -kv[1])} }
+
+    def write(self, output):
+        report = json.dumps(self.report(), indent=2)
+        if output == "-":
+            print(report)
+        else:
+            with open(output, "w") as f:
+                f.write(report + "\n")
+            print(f"wrote the profile to {output}")
+
+profile = None # the RunProfile of this run, with --profile
+
+def profile_stage(name):
+    if profile == None:
+        return contextlib.nullcontext()
+    return profile.stage(name)
+
+STAGE_NAMES = {"schedule": "parse", "mapping": "mapping", "scheduler": "liveinfo"}
+
+def load_inputs(snapshot=None, schedule_filter=None, asset_db=None):
+    """
+    Returns (timezone_id, subevents, mapping, scheduler), reusing the parts of
+    snapshot whose input files didn't change.
+    With a schedule_filter only part of the schedule is parsed (and never
+    snapshotted); liveinfo.xml goes first then, to tell which tracks are plenary.
+    The mapping is never part of snapshot: the packed catalog keeps its own
+    index (see AssetCatalog.load), and with an asset_db it goes through that
+    SQLite catalog, which keeps itself up to date.
+    """
+    def part(name, files, build):
+        with profile_stage(STAGE_NAMES[name]):
+            if snapshot == None:
+                return build()
+            return snapshot.get(name, files, build)
+    if schedule_filter != None:
+        scheduler = part("scheduler", ["liveinfo.xml"], lambda: Scheduler.from_file("liveinfo.xml"))
+        schedule_filter.plenary_tracks.update(scheduler.plenary_tracks())
+        with profile_stage(STAGE_NAMES["schedule"]):
+            timezone_id, subevents = load_schedule("schedule.xml", schedule_filter)
+    else:
+        timezone_id, subevents = part("schedule", ["schedule.xml"], lambda: load_schedule("schedule.xml"))
+    if asset_db != None:
+        with profile_stage(STAGE_NAMES["mapping"]):
+            mapping = VideoMapping.from_db(asset_db, "mapping.xml", "asset-info.csv")
+    else:
+        with profile_stage(STAGE_NAMES["mapping"]):
+            mapping = VideoMapping.from_files("mapping.xml", "asset-info.csv", os.path.join(CACHE_DIR, "assets.pickle"))
+    if schedule_filter == None:
+        scheduler = part("scheduler", ["liveinfo.xml"], lambda: Scheduler.from_file("liveinfo.xml"))
+    if snapshot != None:
+        snapshot.save()
+    return timezone_id, subevents, mapping, scheduler
+
+def code_version():
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
 
 class PlaylistEvent:
     """
@@ -691,6 +1457,9 @@ class PlaylistEvent:
          <voiceoverlist/>
       </event>
     """
+    shared = False # the same object in the playlists of several rooms (plenary prerecordings)
+    xml_bytes = None # to_xml_bytes of a shared event, once it has been serialized
+
     def __init__(self, title, source, category, duration, endmode, onairtime, m, ts, recording=None, recordingPat=None):
         assert isinstance(title, str)
         self.title = title.strip()
@@ -708,28 +1477,50 @@ class PlaylistEvent:
     def __str__(self):
         return f"PlaylistEvent({self.title}; {self.onairtime} for {self.duration}; for {self.ts}; for {self.recordingPat})"
 
-    def to_session_chair_xml(self):
-        event = ET.Element("event")
-        event.set("title", self.title)
-        event.set("start", self.onairtime.isoformat())
-        event.set("nominal_start", self.ts.start_ts.isoformat())
-        event.set("duration", str(self.duration.total_seconds()))
-        event.set("nominal_duration", str(self.ts.end_ts - self.ts.start_ts))
-        event.set("session", self.ts.subevent.title)
-        event.set("event_id", self.ts.event_id)
-        event.set("is_mirror", str(self.ts.is_mirror))
-
-        tracks = ET.Element("tracks")
-        event.append(tracks)
-        for track in self.ts.tracks:
-            track_el = ET.Element("track")
-            track_el.text = track
-            tracks.append(track_el)
-        
-        sources = ET.Element("sources")
-        sources.append(self.source.to_onsite_xml())
-        event.append(sources)
-        return event
+    def chair_fields(self):
+        """
+        The attributes of this event in the session chair xml, in output order
+        """
+        nominal_start, nominal_duration = self.nominal_times()
+        return dict(title=self.title, start=timecode.isoformat(self.onairtime), nominal_start=nominal_start,
+                    duration=str(self.duration.total_seconds()), nominal_duration=str(nominal_duration),
+                    session=self.ts.subevent.title, event_id=self.ts.event_id, is_mirror=str(self.ts.is_mirror))
+
+    def nominal_times(self):
+        """
+        (ts.start_ts.isoformat(), ts.end_ts - ts.start_ts), going through the
+        cached UTC offsets of timecode. The difference is in wall clock time,
+        as both datetimes have the same tzinfo.
+        """
+        ts, timezone = self.ts, self.ts.subevent.timezone
+        if timezone == None:
+            return ts.start_ts.isoformat(), ts.end_ts - ts.start_ts
+        start_offset, end_offset = timecode.epoch_utc_offset(ts.start, timezone), timecode.epoch_utc_offset(ts.end, timezone)
+        return (timecode.epoch_isoformat(ts.start, timezone),
+                datetime.timedelta(seconds=(ts.end + end_offset) - (ts.start + start_offset)))
+
+    def to_chair_xml(self):
+        """
+        The <event> of the session chair xml, serialized the way ET.tostring
+        pretty prints it inside a <session> (leading newline included)
+        """
+        return (CHAIR_EVENT_XML.format(xml_attributes(self.chair_fields()))
+                + chair_tracks_xml(self.ts.tracks)
+                + CHAIR_SOURCES_XML.format(xml_text_element(*self.source.onsite_id())))
+
+    def to_chair_json(self):
+        """
+        The chair_fields of this event for the json chair formats, with the
+        durations in seconds, plus its tracks and sources
+        """
+        fields = self.chair_fields()
+        fields["duration"] = self.duration.total_seconds()
+        fields["nominal_duration"] = self.nominal_times()[1].total_seconds()
+        fields["is_mirror"] = bool(self.ts.is_mirror)
+        fields["tracks"] = list(self.ts.tracks)
+        tag, text = self.source.onsite_id()
+        fields["sources"] = [{tag: text}]
+        return fields
     
     def from_xml(xml):
         """
@@ -737,15 +1528,10 @@ class PlaylistEvent:
         """
         title = xml.xpath("./title/text()")[0]
         category = xml.xpath("./category/text()")[0]
-        ds =  xml.xpath("./duration/text()")[0].split(':')
-
-        duration = datetime.timedelta(hours=int(ds[0]), minutes=int(ds[1]), seconds=int(ds[2]), milliseconds=int(ds[3])*40)
-                     # We have :00 added as frames and iso parser gets confused with that
-        
+        duration = timecode.frames_to_timedelta(timecode.parse_duration(xml.findtext("duration")))
         endmode = xml.xpath("./endmode/text()")[0]
-        onairtime_raw = xml.xpath("./onairtime/text()")[0].replace('T', ' ')
-        onairtime = datetime.datetime.fromisoformat(onairtime_raw[:19])
-        onairtime += datetime.timedelta(milliseconds=int(onairtime_raw[20:22])*40)
+        # naive, in UTC
+        onairtime = timecode.frames_to_datetime(timecode.parse_onairtime(xml.findtext("onairtime")))
         
         recording = xml.xpath("./recording/text()")[0]
         recordingPat = None
@@ -758,75 +1544,152 @@ class PlaylistEvent:
         """
         This returns the etree object
         """
-        # The base element
-        event = ET.Element("event")
+        # The base element, cloned from the template (see EVENT_TEMPLATE) and
+        # then patched with the fields that change from event to event
+        event = copy.deepcopy(EVENT_TEMPLATE)
+        category, title, duration, onairtime, idel, recordingpat = event[:6]
+        recording = event[EVENT_RECORDING]
+
+        fields = self.playlist_fields()
+        category.text = fields["category"]
+        title.text = fields["title"]
+        duration.text = fields["duration"]
+        onairtime.text = fields["onairtime"]
+        idel.tag = fields["id_tag"]
+        idel.text = fields["id"]
+        recordingpat.text = fields["recordingPattern"]
+        recording.text = fields["recording"]
+        return event
 
+    def to_xml_bytes(self):
+        """
+        Serializes straight to the bytes ET.tostring would produce for to_xml()
+        indented as an <event> of a pretty printed playlist (leading newline
+        included), without building any elements.
+        """
+        if self.xml_bytes != None:
+            return self.xml_bytes
+        fields = self.playlist_fields()
+        for key in ["title", "id", "recordingPattern"]:
+            fields[key] = escape_xml_text(fields[key])
+        xml_bytes = EVENT_XML.format_map(fields).encode("utf-8")
+        if self.shared:
+            # the same plenary event in every room, serialized once
+            self.xml_bytes = xml_bytes
+        return xml_bytes
+
+    def playlist_fields(self):
+        """
+        The parts of a playlist <event> that aren't constant
+        """
+        duration = timecode.format_duration(timecode.timedelta_to_frames(self.duration))
 
-        duration = ET.Element("duration")
-        total_secs = self.duration.total_seconds()
-        hours,remainder = divmod(total_secs, 60*60)
-        minutes,remainder = divmod(remainder, 60)
-        seconds,fractional_seconds = divmod(remainder, 1)
-        frames = math.floor(fractional_seconds*25)
-        duration.text = f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}:{int(frames):02d}"
-        
-        
-        title = ET.Element("title")
-        title.text = self.title
         if not self.title:
             print(f"Warning: {self.ts.event_id} has an empty title")
 
-        category_type, idel = self.source.to_playlist_xml() 
-        category = ET.Element("category")
-        category.text = category_type
+        category_type, id_tag, source_id = self.source.playlist_id() 
 
-        onairtime = ET.Element("onairtime")
-        time_text = self.onairtime.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
-        frames = math.floor((self.onairtime.microsecond * 25)/1000000)
-        onairtime.text = f"{time_text}:{frames:02d}"
+        onairtime = timecode.format_onairtime(timecode.datetime_to_frames(self.onairtime))
 
-        recordingpat = ET.Element("recordingPattern")
-        recordingpat.text = self.recording if self.recording != None else ""
-        
-        # Bunch of defaults
-        offset = ET.Element("offset")
-        offset.text = "00:00:00:00"
-        endmode = ET.Element("endmode")
-        endmode.text = "FOLLOW"
-        igincomsig = ET.Element("ignoreincomingscte35signals")
-        igincomsig.text = "false"
-
-        maxExtendedDuration = ET.Element("maxExtendedDuration")
-        maxExtendedDuration.text = "00:00:00:00"
-
-        scte35list = ET.Element("scte35list")
-        secondaryeventlist = ET.Element("secondaryeventlist")
-
-        som = ET.Element("som")
-        som.text = "00:00:00:00"
-        
-        startmode = ET.Element("startmode") ## TODO: I am assuming this is default
-        startmode.text = "FOLLOW"
+        return dict(category=category_type, title=self.title, duration=duration, 
+                    onairtime=onairtime, id_tag=id_tag, id=source_id,
+                    recordingPattern=self.recording if self.recording != None else "",
+                    # TODO: Confirm! if category is not live then we dont have to record,
+                    # or do we record everything or there are some events that we won't record?
+                    recording="true" if self.recording != None else "false")
 
-        twitchrpclist = ET.Element("twitchrpclist")
-        untimedAdList = ET.Element("untimedAdList")
-        voiceoverlist = ET.Element("voiceoverlist")
-        
-        
-        playoutswithlist = ET.Element("playoutswitchlist")
-        recording = ET.Element("recording") # TODO: Confirm! if category is not live then we dont have to record,
-                                            # or do we record everything or there are some events that we won't record?
-        recording.text = "true" if self.recording != None else "false"
+def escape_xml_text(text):
+    """
+    Escapes text content the way libxml2 serializes it
+    """
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    return text
+
+def escape_xml_attr(text):
+    """
+    Escapes an attribute value the way libxml2 serializes it
+    """
+    text = escape_xml_text(text)
+    for c, escaped in [('"', "&quot;"), ("\n", "&#10;"), ("\t", "&#9;")]:
+        if c in text:
+            text = text.replace(c, escaped)
+    return text
 
-        
-        event.extend (
-              [ category, title, duration, onairtime, idel, recordingpat ]
-            + [ offset, endmode, igincomsig, maxExtendedDuration, scte35list
-                , som, playoutswithlist, startmode, recording
-                , twitchrpclist, untimedAdList, voiceoverlist ]
-        )
-        
-        return event
+def xml_attributes(attributes):
+    return " ".join(f'{name}="{escape_xml_attr(value)}"' for name, value in attributes.items())
+
+def xml_text_element(tag, text):
+    if text == None:
+        return f"<{tag}/>"
+    return f"<{tag}>{escape_xml_text(text)}</{tag}>"
+
+def make_event_template():
+    """
+    The <event> skeleton every playlist event is cloned from, in output order.
+    The first six children (category, title, duration, onairtime, the source id
+    and recordingPattern) and recording get filled in by PlaylistEvent.to_xml;
+    everything else is a constant default.
+    """
+    event = ET.Element("event")
+    for tag in ["category", "title", "duration", "onairtime", "mediaid", "recordingPattern"]:
+        ET.SubElement(event, tag)
+
+    # Bunch of defaults
+    defaults = [("offset", "00:00:00:00"), ("endmode", "FOLLOW"), ("ignoreincomingscte35signals", "false"),
+                ("maxExtendedDuration", "00:00:00:00"), ("scte35list", None),
+                ("som", "00:00:00:00"), ("playoutswitchlist", None),
+                ("startmode", "FOLLOW"), ## TODO: I am assuming this is default
+                ("recording", None), ("twitchrpclist", None), ("untimedAdList", None), ("voiceoverlist", None)]
+    for tag, text in defaults:
+        ET.SubElement(event, tag).text = text
+    return event
+
+EVENT_TEMPLATE = make_event_template()
+EVENT_RECORDING = list(EVENT_TEMPLATE).index(EVENT_TEMPLATE.find("recording"))
+
+def make_event_xml():
+    """
+    EVENT_TEMPLATE serialized at the indentation of a playlist <event>, as a
+    format string over PlaylistEvent.playlist_fields.
+    """
+    event = copy.deepcopy(EVENT_TEMPLATE)
+    fields = ["category", "title", "duration", "onairtime", "id", "recordingPattern"]
+    for child, field in zip(event, fields):
+        child.text = "{" + field + "}"
+    event[4].tag = "id_tag" # placeholder, swapped for the format field below
+    event[EVENT_RECORDING].text = "{recording}"
+    ET.indent(event, level=2)
+    xml = ET.tostring(event, encoding="unicode")
+    return "\n    " + xml.replace("id_tag>", "{id_tag}>")
+
+EVENT_XML = make_event_xml()
+
+# The session chair xml, at the indentation ET.tostring pretty prints it with:
+# a <room> per room, a <session> per subevent in it and an <event> per event
+CHAIR_EVENT_XML = "\n      <event {}>"
+CHAIR_SOURCES_XML = "\n        <sources>\n          {}\n        </sources>\n      </event>"
+
+_chair_tracks = dict() # tuple of tracks => their <tracks>, the same few keep coming back
+
+def chair_tracks_xml(tracks):
+    tracks = tuple(tracks)
+    xml = _chair_tracks.get(tracks)
+    if xml == None:
+        if len(tracks) == 0:
+            xml = "\n        <tracks/>"
+        else:
+            xml = ("\n        <tracks>"
+                   + "".join("\n          " + xml_text_element("track", track) for track in tracks)
+                   + "\n        </tracks>")
+        _chair_tracks[tracks] = xml
+    return xml
 
     
 
@@ -834,23 +1697,20 @@ def gen_fillers(room_id, timeslots):
     """
     Takes a list of time ordered timeslot if any two events have a gap then we generate a filler event to fit in the gap
     """
-    adjacent_ts = list(window(timeslots, 2))
     fillers = []
-    for (e1, e2) in adjacent_ts:
-        if e2.onairtime < e1.onairtime + e1.duration:
-            pass #print(f"Warning: Overlapping events {e1.ts.title} {e2.ts.title}")
-        if e2.onairtime > e1.onairtime + e1.duration: # TODO may be the diff should be between a threshold?
-            pass# print(f"We have a {str(e2.onairtime - (e1.onairtime + e1.duration))} hr gap between {e1.title} and {e2.title}")
-
-            #I hate this I hate this I hate this
-            real_id = room_id 
-            if real_id == 'D':
-                real_id = "A"
-
-            fillers.append(PlaylistEvent("FILLER_"+real_id,
-                FillerStream("FILLER"+real_id), "LIVE", e2.onairtime - (e1.onairtime + e1.duration), e1.endmode, e1.onairtime + e1.duration, # start after the prev event ends
-                                         None, # We don't have a mapping or timeslot xml object for fillers
-                                         None))
+    _, gaps = find_overlaps_and_gaps(*playlist_bounds(timeslots))
+    for i in gaps: # TODO may be the diff should be between a threshold?
+        e1, e2 = timeslots[i], timeslots[i+1]
+
+        #I hate this I hate this I hate this
+        real_id = room_id 
+        if real_id == 'D':
+            real_id = "A"
+
+        fillers.append(PlaylistEvent("FILLER_"+real_id,
+            FillerStream("FILLER"+real_id), "LIVE", e2.onairtime - (e1.onairtime + e1.duration), e1.endmode, e1.onairtime + e1.duration, # start after the prev event ends
+                                     None, # We don't have a mapping or timeslot xml object for fillers
+                                     None))
     return fillers
         
 
@@ -870,127 +1730,821 @@ def gen_fillers(room_id, timeslots):
 #     return list(sorted ((pl + fillers), key=lambda x: x.onairtime))
 
 
-def window(iterable, size):
+def playlist_bounds(pl):
+    """
+    Start and end times of the events of a playlist as integer microseconds
+    since the epoch (UTC), whatever tzinfo object each event's onairtime has
+    """
+    starts = [timecode.datetime_to_micros(evt.onairtime) for evt in pl]
+    durations = [evt.duration // timecode.ONE_MICROSECOND for evt in pl]
+    if np != None:
+        starts = np.array(starts, dtype=np.int64)
+        return starts, starts + np.array(durations, dtype=np.int64)
+    return starts, [start + duration for start, duration in zip(starts, durations)]
+
+def find_overlaps_and_gaps(starts, ends):
+    """
+    For events in the order given, returns the positions i where event i runs
+    over event i+1 and the ones where there's a gap before event i+1.
+    One vectorized pass when numpy is around.
+    """
+    if np != None and isinstance(starts, np.ndarray):
+        slack = starts[1:] - ends[:-1]
+        return np.flatnonzero(slack < 0).tolist(), np.flatnonzero(slack > 0).tolist()
+    overlaps, gaps = [], []
+    for i in range(len(starts) - 1):
+        if starts[i+1] < ends[i]:
+            overlaps.append(i)
+        elif starts[i+1] > ends[i]:
+            gaps.append(i)
+    return overlaps, gaps
+
+def sort_by_start(pl, starts, ends):
     """
-    sliding window over an iterable
-    src: https://stackoverflow.com/questions/6822725/rolling-or-sliding-window-iterator 
+    pl, starts and ends stably sorted by start time
     """
-    iters = tee(iterable, size)
-    for i in range(1, size):
-        for each in iters[i:]:
-            next(each, None)
-    return list(zip(*iters))
+    if np != None and isinstance(starts, np.ndarray):
+        order = np.argsort(starts, kind="stable")
+        return [pl[i] for i in order], starts[order], ends[order]
+    order = sorted(range(len(pl)), key=starts.__getitem__)
+    return [pl[i] for i in order], [starts[i] for i in order], [ends[i] for i in order]
 
 def validate_playlist(pl):
     """
     For a room, we don't want multiple events running or 
     two adjacent events overlap each other.
     """
-    sorted_pl = sorted(pl, key=lambda x: x.onairtime)
-    adj_evs = list(window(sorted_pl, 2))
-    for (e1, e2) in adj_evs:
-        if e2.onairtime < e1.onairtime + e1.duration:
-            print(f"{e1.title} ({e1.ts.event_id}@{e1.onairtime}-{e1.duration.total_seconds()}) runs over {e2.title} ({e2.ts.event_id}@{e2.onairtime}-{e2.duration.total_seconds()}) by {((e1.onairtime + e1.duration) - e2.onairtime).total_seconds()}")
+    sorted_pl, starts, ends = sort_by_start(pl, *playlist_bounds(pl))
+    overlaps, _ = find_overlaps_and_gaps(starts, ends)
+    for i in overlaps:
+        e1, e2 = sorted_pl[i], sorted_pl[i+1]
+        print(f"{e1.title} ({e1.ts.event_id}@{e1.onairtime}-{e1.duration.total_seconds()}) runs over {e2.title} ({e2.ts.event_id}@{e2.onairtime}-{e2.duration.total_seconds()}) by {((e1.onairtime + e1.duration) - e2.onairtime).total_seconds()}")
         
     
-def make_chair_xml(room_playlists, scheduler):
-    room_map = dict()
-    for room,evts in room_playlists.items():
-        session_map = dict()
-        evts.sort(key=lambda evt: evt.onairtime)
-        for evt in evts:
-            in_subevent = session_map.get(evt.ts.subevent, [])
-            in_subevent.append(evt.to_session_chair_xml())
-            session_map[evt.ts.subevent] = in_subevent
-        room_map[room] = session_map
-    chair_xml_root = ET.Element("conference")
+CHAIR_FORMATS = {"xml": "_chair.xml", "json": "_chair.json", "ndjson": "_chair.ndjson"} # format => file suffix
+
+def chair_sessions(evts):
+    """
+    The (subevent, events) sessions of a room playlist, in the order of their
+    first event. Room playlists come out of the RoomTimelines in onairtime
+    order already, so evts is only sorted (a copy of it) when it isn't.
+    """
+    if any(b.onairtime < a.onairtime for a, b in zip(evts, islice(evts, 1, None))):
+        evts = sorted(evts, key=lambda evt: evt.onairtime)
+    sessions = dict()
+    for evt in evts:
+        session = sessions.get(evt.ts.subevent)
+        if session == None:
+            session = sessions[evt.ts.subevent] = []
+        session.append(evt)
+    return sessions.items()
+
+def chair_rooms(room_playlists, serialize):
+    """
+    Yields (room, [(subevent, serialized events)]) a room at a time, so only
+    one room is held serialized. Shared plenary events are serialized once.
+    """
+    shared = dict() # id(evt) => serialized
+    def serialized(evt):
+        if not evt.shared:
+            return serialize(evt)
+        if not id(evt) in shared:
+            shared[id(evt)] = serialize(evt)
+        return shared[id(evt)]
+    for room, evts in room_playlists.items():
+        yield room, [(subevent, list(map(serialized, session))) for subevent, session in chair_sessions(evts)]
+
+def compact_json(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def write_chair(output_file, room_playlists, scheduler, timezone_id, chair_format="xml"):
+    """
+    Streams the session chair view of room_playlists (rooms, the sessions in
+    them and their events) to output_file, a room at a time, without touching
+    room_playlists. chair_format is one of CHAIR_FORMATS:
+      xml     what ET.tostring pretty prints for the <conference> tree
+      json    the same as one compact json document
+              {main_start, main_end, timezone, rooms: [{name, sessions: [{title, track, events}]}]}
+      ndjson  a line with main_start, main_end, timezone and the room names,
+              then a line per session, with the name of its room
+    Returns the number of events written.
+    """
+    header = dict()
     if scheduler.main_start != None and scheduler.main_end != None:
-        chair_xml_root.set("main_start", scheduler.main_start.isoformat())
-        chair_xml_root.set("main_end", scheduler.main_end.isoformat())
-    chair_xml_root.set("timezone", schedule_xml.xpath("//timezone_id/text()")[0])
-    for room, session_map in room_map.items():
-        room_elem = ET.Element("room")
-        room_elem.set("name", room)
-        for session, evts in session_map.items():
-            session_elem = ET.Element("session")
-            session_elem.set("title", session.title)
-            session_elem.set("track", session.tracks[0])
-            session_elem.extend(evts)
-            room_elem.append(session_elem)
-        chair_xml_root.append(room_elem)
-    return chair_xml_root
+        header["main_start"] = scheduler.main_start.isoformat()
+        header["main_end"] = scheduler.main_end.isoformat()
+    header["timezone"] = timezone_id
+    serialize = PlaylistEvent.to_chair_xml if chair_format == "xml" else PlaylistEvent.to_chair_json
+    events = 0
+    with open(output_file, "w", encoding="utf-8", newline="") as f:
+        if chair_format == "xml":
+            f.write("<?xml version='1.0' encoding='utf-8' standalone='yes'?>\n")
+            f.write(f"<conference {xml_attributes(header)}")
+            if len(room_playlists) == 0:
+                f.write("/>\n")
+                return events
+            f.write(">")
+        elif chair_format == "json":
+            f.write(compact_json(header)[:-1] + ',"rooms":[') # header without its closing brace
+        else:
+            f.write(compact_json(dict(header, rooms=list(room_playlists))) + "\n")
+
+        for i, (room, sessions) in enumerate(chair_rooms(room_playlists, serialize)):
+            events += sum(len(evts) for _, evts in sessions)
+            if chair_format == "xml":
+                if len(sessions) == 0:
+                    f.write(f'\n  <room name="{escape_xml_attr(room)}"/>')
+                    continue
+                f.write(f'\n  <room name="{escape_xml_attr(room)}">')
+                for subevent, evts in sessions:
+                    f.write(f"\n    <session {xml_attributes(dict(title=subevent.title, track=subevent.tracks[0]))}>")
+                    f.write("".join(evts))
+                    f.write("\n    </session>")
+                f.write("\n  </room>")
+            else:
+                sessions = [dict(title=subevent.title, track=subevent.tracks[0], events=evts) for subevent, evts in sessions]
+                if chair_format == "json":
+                    f.write(("," if i > 0 else "") + compact_json(dict(name=room, sessions=sessions)))
+                else:
+                    f.writelines(compact_json(dict(room=room, **session)) + "\n" for session in sessions)
+
+        if chair_format == "xml":
+            f.write("\n</conference>\n")
+        elif chair_format == "json":
+            f.write("]}\n")
+    return events
+
+def write_playlist_xml(output_file, room_name, events):
+    """
+    Streams a <playlist> to output_file, serializing and writing each <event>
+    as soon as it's produced rather than building the whole tree first.
+    The bytes are the same as pretty printing the full tree.
+    """
+    events = iter(events)
+    first = next(events, None)
+    written = 0
+    with open(output_file, "wb") as f:
+        # unbuffered so every event goes straight through to the file
+        with ET.xmlfile(f, encoding='utf-8', buffered=False) as xf:
+            xf.write_declaration(standalone=True)
+            with xf.element("playlist"):
+                listmeta = ET.Element("list")
+                name = ET.Element("name")
+                name.text = room_name
+                listmeta.append(name)
+                ET.indent(listmeta, level=1)
+                xf.write("\n  ")
+                xf.write(listmeta)
+                xf.write("\n  ")
+
+                if first == None:
+                    xf.write(ET.Element("eventlist", timeinmilliseconds="true"))
+                else:
+                    with xf.element("eventlist", timeinmilliseconds="true"):
+                        for evt in chain([first], events):
+                            # xf is unbuffered, so the event's bytes can go straight to f
+                            f.write(evt.to_xml_bytes())
+                            written += 1
+                        xf.write("\n  ")
+                xf.write("\n")
+        f.write(b"\n")
+    return written
+
+def write_room_playlist(room_id, playlist, diff=False, suffix="", output=base_output_file, base_room=base_room):
+    """
+    Fills the gaps of a room's (start ordered) playlist and writes it out
+    (to {output}ROOM.xml, or {output}ROOM{suffix}.xml).
+    With diff, also writes the changes against the playlist that was there
+    before (see playlistdiff.py) next to it.
+    Returns (the name of the file written, number of fillers, number of events
+    written, number of changes or None without diff).
+    Only depends on its arguments, so rooms can be written in worker processes.
+    """
+    # a single event_id can appear more than once 
+    # (they're duplicated for mirrored events)
+    # so we can't build a map based on them. Only slot_ids are unique.
+    fillers = gen_fillers(room_id, playlist)
+    events = filter(lambda evt: evt.duration.total_seconds() > 0, chain(playlist, fillers))
+
+    output_file = output + room_id + suffix + ".xml"
+    previous = None
+    if diff:
+        events = list(events)
+        previous = playlistdiff.read_playlist(output_file) if os.path.exists(output_file) else []
+
+    # write it to a file
+    written = write_playlist_xml(output_file, base_room + room_id, events)
+
+    changes = None
+    if diff:
+        fields = (evt.playlist_fields() for evt in events)
+        change_set = playlistdiff.diff_playlists(previous, [tuple(f[k] for k in playlistdiff.FIELDS) for f in fields])
+        with open(output + room_id + suffix + ".diff.json", "w", encoding="utf-8") as f:
+            playlistdiff.write_change_set(change_set, f)
+        changes = len(change_set["changes"])
+    return output_file, len(fillers), written, changes
+
+def make_onair_index(room_playlists, base_room=base_room, room_ids=room_ids):
+    """
+    A "what is on air" index over the playlists of room_ids, with the same
+    events (fillers included) as the files write_room_playlist writes
+    """
+    room_events = dict()
+    for r in room_ids:
+        playlist = room_playlists.get(base_room + r, [])
+        fillers = gen_fillers(r, playlist)
+        room_events[base_room + r] = [evt for evt in chain(playlist, fillers) if evt.duration.total_seconds() > 0]
+    return onair.OnAirIndex(room_events)
+
+def parse_query_time(text, timezone):
+    """
+    "now" or an ISO date and time, in the schedule's timezone unless it says otherwise
+    """
+    if text == "now":
+        return datetime.datetime.now(timezone)
+    when = datetime.datetime.fromisoformat(text)
+    if when.tzinfo == None:
+        when = when.replace(tzinfo=timezone)
+    return when
+
+def query_onair(args, room_playlists, timezone):
+    """
+    Answers the onair subcommand: what is on air at --at, or --to, --within or --next from there
+    """
+    index = make_onair_index(room_playlists)
+    room = None
+    if args.room != None:
+        room = args.room if args.room in index.rooms else base_room + args.room
+        if not room in index.rooms:
+            raise SystemExit(f"no room {args.room}, there's {', '.join(index.rooms)}")
+    when = parse_query_time(args.at, timezone)
+    if args.to != None:
+        found = index.between(when, parse_query_time(args.to, timezone), room)
+    elif args.within != None:
+        found = index.starting(when, when + datetime.timedelta(minutes=args.within), room)
+    elif args.next != None:
+        found = index.next(when, args.next, room)
+    else:
+        found = index.at(when, room)
+    for r, evt in found:
+        start = evt.onairtime.astimezone(timezone)
+        end = (evt.onairtime + evt.duration).astimezone(timezone)
+        print(f"{r}: {start:%Y-%m-%d %H:%M:%S}-{end:%H:%M:%S} {evt.category:<7} {evt.title}")
+    return found
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generates the room playlists and the session chair file")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="write the room playlists in N worker processes (default: 1, no workers)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help=f"keep the parsed inputs in {CACHE_DIR} and skip parsing the files that didn't change")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"reuse the scheduling of subevents whose inputs didn't change since the last run (kept in {CACHE_DIR})")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and regenerate the outputs whenever an input file changes")
+    parser.add_argument("--debounce", type=float, default=0.2,
+                        help="with --watch, wait until the inputs have been quiet for this many seconds (default: 0.2)")
+    parser.add_argument("--profile", nargs="?", const="profile.json", metavar="FILE",
+                        help="time every stage, track peak memory (tracemalloc, which slows the run down) and count "
+                        + "what the hot paths do; writes json to FILE (default: profile.json, - for stdout)")
+    parser.add_argument("--cprofile", metavar="FILE",
+                        help="with --profile, also dump cProfile stats of the scheduling stage to FILE")
+    parser.add_argument("--asset-db", action="store_const", const=ASSET_DB_FILE,
+                        help="look the mapping and asset durations up in a SQLite catalog (--asset-db-path) "
+                        + "that only imports what changed in mapping.xml and asset-info.csv")
+    parser.add_argument("--asset-db-path", metavar="FILE",
+                        help=f"where the --asset-db catalog is (default: {ASSET_DB_FILE}); implies --asset-db")
+    parser.add_argument("--diff", action="store_true",
+                        help="also write what changed in every room playlist since the last run, "
+                        + "as a compact json change set next to it (ROOM.diff.json)")
+    parser.add_argument("--chair-format", choices=list(CHAIR_FORMATS), default="xml",
+                        help="write the session chair file as pretty printed xml (default), one compact json "
+                        + "document or ndjson with a line per session")
+    parser.add_argument("--rooms", metavar="ROOMS",
+                        help="only generate the playlists of these rooms (comma separated letters or full names)")
+    parser.add_argument("--from", dest="start", metavar="TIME", type=parse_window_time,
+                        help="only generate the subevents running at or after TIME (ISO date/time, in the schedule's "
+                        + f"timezone unless it says otherwise, or now); the playlists go to ROOM{WINDOW_SUFFIX}.xml")
+    parser.add_argument("--until", dest="end", metavar="TIME", type=parse_window_end,
+                        help="only generate the subevents running before TIME (like --from, or +HOURS after --from)")
+    commands = parser.add_subparsers(dest="command")
+    query = commands.add_parser("onair", help="show what is on air instead of writing the outputs")
+    query.add_argument("--room", help="only this room (its letter or full name)")
+    query.add_argument("--at", default="now",
+                       help="what is on air at this ISO date/time, in the schedule's timezone by default (default: now)")
+    kinds = query.add_mutually_exclusive_group()
+    kinds.add_argument("--to", help="what is on air at some point between --at and this time")
+    kinds.add_argument("--within", type=float, metavar="MINUTES", help="what starts in the next MINUTES after --at")
+    kinds.add_argument("--next", type=int, metavar="N", help="the next N events starting from --at")
+    batch = commands.add_parser("batch", help="generate the outputs of every conference in a manifest, "
+                                + "sharing one mapping and asset catalog (in worker processes)")
+    batch.add_argument("manifest", help="json manifest of the jobs (see README.md)")
+    batch.add_argument("--jobs", "-j", dest="batch_jobs", type=int, metavar="N",
+                       help="run up to N jobs at a time, each in a worker process (default: the -j before batch "
+                       + "if given, otherwise one per job; 1 runs them one after another)")
+    batch.add_argument("--report", metavar="FILE", help="also write the timings of every job as json to FILE")
+    imports = commands.add_parser("import-assets", help="upsert asset-info style csv and mapping style xml files "
+                                  + "into the --asset-db catalog")
+    imports.add_argument("files", nargs="+", help=".csv files of assets and .xml files of mappings")
+    args = parser.parse_args(argv)
+    if args.asset_db_path != None:
+        args.asset_db = args.asset_db_path
+    if args.diff and (args.start != None or args.end != None):
+        parser.error(f"--diff compares against the published playlists, which --from/--until don't write "
+                     + f"(they write ROOM{WINDOW_SUFFIX}.xml)")
+    if args.command == "batch":
+        # every job is a plain full run, with the rooms and chair format of its manifest entry
+        ignored = [flag for flag, given in [("--snapshot", args.snapshot), ("--incremental", args.incremental),
+                                            ("--watch", args.watch), ("--profile", args.profile != None),
+                                            ("--cprofile", args.cprofile != None), ("--diff", args.diff),
+                                            ("--rooms", args.rooms != None), ("--from", args.start != None),
+                                            ("--until", args.end != None)] if given]
+        if len(ignored) > 0:
+            parser.error(f"batch doesn't take {', '.join(ignored)}")
+    return args
+
+WINDOW_SUFFIX = ".window" # after the room in the file names of the playlists of a --from/--until run
+
+def parse_window_time(text):
+    """
+    "now" or an ISO date and time; naive ones are in the schedule's timezone (which isn't known yet)
+    """
+    if text == "now":
+        return datetime.datetime.now(datetime.timezone.utc)
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} isn't an ISO date/time or now")
+
+def parse_window_end(text):
+    """
+    Like parse_window_time, or "+HOURS": a timedelta to add to --from
+    """
+    if not text.startswith("+"):
+        return parse_window_time(text)
+    try:
+        return datetime.timedelta(hours=float(text[1:]))
+    except (ValueError, OverflowError):
+        raise argparse.ArgumentTypeError(f"{text!r} isn't +HOURS")
+
+def make_schedule_filter(args):
+    """
+    Returns the ScheduleFilter for --rooms, --from and --until (None without
+    any of them) and the ids of the rooms to write
+    """
+    write_ids = room_ids
+    rooms = None
+    if args.rooms != None:
+        write_ids = []
+        for name in args.rooms.split(","):
+            r = name.strip()
+            if r.startswith(base_room):
+                r = r[len(base_room):]
+            if not r in room_ids:
+                raise SystemExit(f"no room {name}, there's {', '.join(room_ids)}")
+            write_ids.append(r)
+        rooms = set(base_room + r for r in write_ids)
+    start, end = args.start, args.end
+    if isinstance(end, datetime.timedelta):
+        if start == None:
+            start = datetime.datetime.now(datetime.timezone.utc)
+        end = start + end
+    if rooms == None and start == None and end == None:
+        return None, write_ids
+    return ScheduleFilter(rooms, start, end), write_ids
+
+def schedule_subevents(scheduler, mapping, subevents, rooms, cache=None):
+    """
+    Schedules the subevents taking place in rooms, going through cache if there is one
+    """
+    schedule = RoomTimeline()
+    for se in subevents:
+        if not se.room in rooms:
+            continue
+        if cache != None:
+            schedule.merge(cache.schedule(scheduler, mapping, se))
+        else:
+            schedule.merge(scheduler.schedule(mapping, se))
+    return schedule
+
+def compact_rooms(scheduler, schedule):
+    """
+    Lays the events of compact_recorded subevents back to back, taking the
+    slack out of the ones that will give time up (see offer_time), in one
+    sweep over each room's timeline.
+    A run of events stops at the next event of another subevent and at plenary
+    events: those play in every room at once, so they are never moved. The
+    last event of a run takes up what is left of the slack, so the run still
+    ends where it was scheduled to.
+    Returns a new RoomTimeline. Moved events are copies; schedule (and the
+    ScheduleCache entries it was merged from) stays as it was.
+    """
+    compacted = RoomTimeline()
+    compact = dict() # subevent_id => compact_recorded of its EventSpec
+    moved = 0
+    for room, evts in schedule.items():
+        out = []
+        run = None # subevent_id of the run being compacted
+        now = None # end of the run so far
+        offset = datetime.timedelta()
+        for evt in evts:
+            subevent = evt.timeslot.subevent
+            if run != None and subevent.subevent_id == run and not evt.plenary:
+                if evt.start == now:
+                    # already back to back, nothing to take out
+                    now = now + evt.duration
+                    offset = datetime.timedelta()
+                    out.append(evt)
+                    continue
+                evt = evt.copy()
+                offset = evt.start - now
+                evt.start = now
+                offset -= evt.offer_time(offset)
+                now = now + evt.duration
+                out.append(evt)
+                moved += 1
+                continue
+            if offset:
+                out[-1].duration += offset # a copy, offset only comes from moved events
+            offset = datetime.timedelta()
+            if not subevent.subevent_id in compact:
+                compact[subevent.subevent_id] = scheduler.event_spec(subevent).compact_recorded
+            run = None
+            if compact[subevent.subevent_id] and not evt.plenary:
+                run = subevent.subevent_id
+                now = evt.start + evt.duration
+            out.append(evt)
+        if offset:
+            out[-1].duration += offset
+        compacted.add(room, out)
+    if profile != None:
+        profile.count("events compacted", moved)
+    return compacted
+
+def make_room_playlists(schedule):
+    room_playlists = dict()
+    shared = dict() # id(evt) => PlaylistEvent, for the plenary events that are in more than one room
+    def playlist_element(evt):
+        if not evt.plenary:
+            return evt.make_playlist_element()
+        element = shared.get(id(evt))
+        if element == None:
+            element = evt.make_playlist_element()
+            element.shared = True
+            shared[id(evt)] = element
+        return element
+    for room, evts in schedule.items():
+        room_playlists[room] = list(map(playlist_element, evts))
+        validate_playlist(room_playlists[room])
+    return room_playlists
+
+def print_changes(result):
+    output_file, _, _, changes = result
+    if changes != None:
+        print(f"{changes} changes since the previous {output_file} in {output_file[:-len('.xml')]}.diff.json")
+
+def write_outputs(room_playlists, scheduler, timezone_id, jobs=1, only_rooms=None, chair=True, diff=False, chair_format="xml",
+                  suffix="", output=base_output_file, base_room=base_room, room_ids=room_ids):
+    """
+    Writes the playlists of room_ids (or just only_rooms, with suffix after
+    the room in their file names) and the session chair file (in
+    chair_format) to files starting with output; with diff, the changes to
+    the room playlists too
+    """
+    write_ids = [r for r in room_ids if only_rooms == None or base_room + r in only_rooms]
+    output_session_chair_file = output + CHAIR_FORMATS[chair_format]
+    chair_events = 0
+    results = []
+    if jobs > 1:
+        # rooms are independent from here on; the chair is written meanwhile
+        # (write_chair leaves room_playlists as it is)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+            written = []
+            with profile_stage("room playlists"):
+                for r in write_ids:
+                    print(f"Generating Playlist for {base_room + r}")
+                    written.append(pool.submit(write_room_playlist, r, room_playlists.get(base_room + r, []), diff, suffix,
+                                               output, base_room))
+            if chair:
+                with profile_stage("chair"):
+                    chair_events = write_chair(output_session_chair_file, room_playlists, scheduler, timezone_id, chair_format)
+            with profile_stage("room playlists"):
+                for result in written:
+                    results.append(result.result())
+                    print(f"writing to file {results[-1][0]}")
+                    print_changes(results[-1])
+    else:
+        with profile_stage("room playlists"):
+            for r in write_ids:
+                print(f"Generating Playlist for {base_room + r}")
+                results.append(write_room_playlist(r, room_playlists.get(base_room + r, []), diff, suffix,
+                                                   output, base_room))
+                print(f"writing to file {results[-1][0]}")
+                print_changes(results[-1])
+        if chair:
+            with profile_stage("chair"):
+                chair_events = write_chair(output_session_chair_file, room_playlists, scheduler, timezone_id, chair_format)
+    if profile != None:
+        for _, fillers, events, _ in results:
+            profile.count("fillers generated", fillers)
+            profile.count("events serialized", events)
+        profile.count("chair events", chair_events)
+
+    if chair:
+        print(f"writing to file {output_session_chair_file}")
+
+class BatchJob:
+    """
+    One conference (or venue) of a batch manifest: its own schedule and
+    liveinfo, the rooms to write playlists for and where the outputs go
+    (base_output_file for the job, which may include a directory) and the
+    format of its chair file
+    """
+    def __init__(self, name, schedule_file, liveinfo_file, output, base_room, room_ids, chair_format="xml"):
+        self.name = name
+        self.schedule_file = schedule_file
+        self.liveinfo_file = liveinfo_file
+        self.output = output
+        self.base_room = base_room
+        self.room_ids = room_ids
+        self.chair_format = chair_format
+
+    @classmethod
+    def from_json(cls, entry, directory):
+        """
+        A "jobs" entry of the manifest; files are relative to the manifest's directory
+        """
+        name = entry["name"]
+        chair_format = entry.get("chair_format", "xml")
+        if not chair_format in CHAIR_FORMATS:
+            raise RuntimeError(f"Unknown chair_format {chair_format} for job {name}, expected one of {', '.join(CHAIR_FORMATS)}")
+        return cls(name,
+                   os.path.join(directory, entry.get("schedule", "schedule.xml")),
+                   os.path.join(directory, entry.get("liveinfo", "liveinfo.xml")),
+                   os.path.join(directory, entry.get("output", os.path.join(name, base_output_file))),
+                   entry.get("base_room", base_room),
+                   entry.get("rooms", room_ids),
+                   chair_format)
+
+def load_manifest(manifest_file):
+    """
+    Returns (mapping file, asset info file, [BatchJob]) of a manifest like
+      {"mapping": "mapping.xml", "asset_info": "asset-info.csv",
+       "jobs": [{"name": "splash", "schedule": "splash/schedule.xml", "liveinfo": "splash/liveinfo.xml",
+                 "output": "out/splash/SPLASH21-", "base_room": "Zurich ", "rooms": ["D", "B", "C"],
+                 "chair_format": "json"}]}
+    """
+    with open(manifest_file) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_file)
+    jobs = [BatchJob.from_json(entry, directory) for entry in manifest["jobs"]]
+    names = [job.name for job in jobs]
+    if len(set(names)) != len(names):
+        raise RuntimeError(f"Repeated job names in {manifest_file}: {names}")
+    return (os.path.join(directory, manifest.get("mapping", "mapping.xml")),
+            os.path.join(directory, manifest.get("asset_info", "asset-info.csv")), jobs)
+
+@contextlib.contextmanager
+def timed(seconds, name):
+    start = time.perf_counter()
+    yield
+    seconds[name] = seconds.get(name, 0) + time.perf_counter() - start
+
+def run_batch_job(job, mapping):
+    """
+    Generates the outputs of job with the shared mapping. Its chatter is
+    captured rather than interleaved with the other jobs'.
+    Returns (job name, seconds per stage, counts, captured output).
+    """
+    seconds = dict()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        if os.path.dirname(job.output) != "":
+            os.makedirs(os.path.dirname(job.output), exist_ok=True)
+        with timed(seconds, "parse"):
+            timezone_id, subevents = load_schedule(job.schedule_file)
+        with timed(seconds, "liveinfo"):
+            scheduler = Scheduler.from_file(job.liveinfo_file)
+        with timed(seconds, "scheduling"):
+            # every room of the venue, for the plenaries of the rooms that aren't written
+            rooms = [room.name for room in scheduler.rooms]
+            schedule = schedule_subevents(scheduler, mapping, subevents, rooms)
+        with timed(seconds, "compaction"):
+            schedule = compact_rooms(scheduler, schedule)
+        with timed(seconds, "playlists"):
+            room_playlists = make_room_playlists(schedule)
+        with timed(seconds, "outputs"):
+            write_outputs(room_playlists, scheduler, timezone_id, chair_format=job.chair_format,
+                          output=job.output, base_room=job.base_room, room_ids=job.room_ids)
+        counts = { "subevents": len(subevents)
+                 , "events": sum(len(room_playlists.get(job.base_room + r, [])) for r in job.room_ids) }
+    return job.name, seconds, counts, log.getvalue()
+
+batch_mapping = None # the shared VideoMapping, in batch worker processes
+
+def init_batch_worker(mapping):
+    global batch_mapping
+    batch_mapping = mapping
+
+def run_batch_job_in_worker(job):
+    return run_batch_job(job, batch_mapping)
+
+def run_batch(args):
+    """
+    Runs every job of the manifest: the mapping and asset catalog are loaded
+    once and handed to the worker processes (each gets its copy when it
+    starts, not one per job), which take the jobs one at a time.
+    """
+    started = time.perf_counter()
+    mapping_file, asset_info_file, jobs = load_manifest(args.manifest)
+    start = time.perf_counter()
+    if args.asset_db != None:
+        mapping = VideoMapping.from_db(args.asset_db, mapping_file, asset_info_file)
+    else:
+        mapping = VideoMapping.from_files(mapping_file, asset_info_file, os.path.join(CACHE_DIR, "assets.pickle"))
+    mapping_seconds = time.perf_counter() - start
+    print(f"loaded the mapping in {mapping_seconds:.3f}s, running {len(jobs)} jobs")
+
+    workers = args.batch_jobs
+    if workers == None:
+        workers = args.jobs if args.jobs > 1 else len(jobs)
+    results = dict() # job name => result or exception
+    if workers > 1 and len(jobs) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                                                    initializer=init_batch_worker, initargs=(mapping,)) as pool:
+            futures = {pool.submit(run_batch_job_in_worker, job): job.name for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+    else:
+        for job in jobs:
+            try:
+                results[job.name] = run_batch_job(job, mapping)
+            except Exception as e:
+                results[job.name] = e
+
+    report = { "mapping_seconds": round(mapping_seconds, 6), "jobs": [] }
+    failed = 0
+    for job in jobs:
+        result = results[job.name]
+        print(f"== {job.name}")
+        if isinstance(result, Exception):
+            print(f"failed: {result!r}")
+            report["jobs"].append({ "name": job.name, "error": repr(result) })
+            failed += 1
+            continue
+        _, seconds, counts, log = result
+        print(log, end="")
+        total = sum(seconds.values())
+        print(f"{job.name}: {counts['events']} events from {counts['subevents']} subevents in {total:.3f}s ("
+              + ", ".join(f"{stage} {s:.3f}s" for stage, s in seconds.items()) + ")")
+        report["jobs"].append({ "name": job.name, "output": job.output, "counts": counts, "total": round(total, 6)
+                              , "seconds": {stage: round(s, 6) for stage, s in seconds.items()} })
+    report["seconds"] = round(time.perf_counter() - started, 6)
+    print(f"ran {len(jobs) - failed} of {len(jobs)} jobs in {report['seconds']:.3f}s")
+
+    if args.report != None:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    return failed == 0
+
+def import_assets(args):
+    """
+    Imports extra files into the asset database; later imports win over earlier ones
+    """
+    db = assetdb.AssetDB(args.asset_db if args.asset_db != None else ASSET_DB_FILE)
+    for path in args.files:
+        if path.endswith(".csv"):
+            count = db.import_file(path, "assets", read_asset_info, appendable=True)
+        elif path.endswith(".xml"):
+            count = db.import_file(path, "mappings", read_mapping)
+        else:
+            raise SystemExit(f"don't know what {path} is, expected a .csv of assets or an .xml of mappings")
+        print(f"imported {count} rows from {path}")
+    assets, events = db.counts()
+    print(f"{db.path} has {assets} assets and {events} mapped events")
+    db.close()
+
+def watch(args):
+    """
+    Regenerates the outputs whenever one of the input files changes.
+    Parsed inputs and scheduling results stay in memory between runs, so only
+    the changed files are re-parsed, only the changed subevents rescheduled and
+    only the rooms whose playlist depends on them written out (along with the
+    chair file).
+    """
+    rooms = [base_room + r for r in room_ids]
+    inputs = InputSnapshot(None)
+    cache = ScheduleCache(None)
+    watcher = filewatch.make_watcher(INPUT_FILES)
+    print(f"watching {', '.join(INPUT_FILES)} ({type(watcher).__name__})")
+
+    published = dict() # room => fingerprints of the subevents its current playlist was made from
+    changed = set(INPUT_FILES)
+    while True:
+        start = time.perf_counter()
+        try:
+            cache.start_run()
+            timezone_id, subevents, mapping, scheduler = load_inputs(inputs, asset_db=args.asset_db)
+            schedule = schedule_subevents(scheduler, mapping, subevents, rooms, cache)
+            sources = {room: [fp for fp, scheduled in cache.used.items() if room in scheduled.events]
+                       for room in rooms}
+            affected = [room for room in rooms if published.get(room) != sources[room]]
+            room_playlists = make_room_playlists(compact_rooms(scheduler, schedule))
+            write_outputs(room_playlists, scheduler, timezone_id, args.jobs, only_rooms=affected,
+                          chair=len(affected) > 0 or len(changed & {"schedule.xml", "liveinfo.xml"}) > 0,
+                          diff=args.diff, chair_format=args.chair_format)
+            published.update((room, sources[room]) for room in affected)
+            elapsed = time.perf_counter() - start
+            print(f"regenerated {len(affected)} room(s) in {elapsed*1000:.0f}ms "
+                  + f"(rescheduled {cache.rescheduled} subevents after changes to {', '.join(sorted(changed))})")
+        except Exception as e:
+            # most likely a half saved or broken input; wait for the next edit
+            print(f"regeneration failed after changes to {', '.join(sorted(changed))}: {e!r}")
+        changed = set(os.path.basename(p) for p in filewatch.wait_for_changes(watcher, args.debounce))
 
 # prduces 3 files "SPLASH-2021-playlist-demo-Zurich{A|B|C}.xml"
-if __name__ == '__main__':
+def main(argv=None):
+    args = parse_args(argv)
     print("howdy")    
     rooms = [base_room + r for r in room_ids]
 
-
-    schedule_xml = ET.parse("schedule.xml")
-
-    schedule_timezone = TZ.gettz(schedule_xml.xpath("//timezone_id/text()")[0])
+    schedule_filter, write_ids = make_schedule_filter(args)
+    if args.watch:
+        if schedule_filter != None:
+            raise SystemExit("--watch regenerates everything, it doesn't take --rooms, --from or --until")
+        try:
+            watch(args)
+        except KeyboardInterrupt:
+            print("bye")
+        return
+
+    if args.command == "import-assets":
+        import_assets(args)
+        return
+
+    if args.command == "batch":
+        if not run_batch(args):
+            sys.exit(1)
+        return
+
+    if args.profile != None:
+        global profile
+        profile = RunProfile(args.cprofile)
+        profile.start()
+
+    snapshot = None
+    if args.snapshot:
+        snapshot = InputSnapshot(os.path.join(CACHE_DIR, "inputs.pickle"))
+    timezone_id, subevents, mapping, scheduler = load_inputs(snapshot, schedule_filter, args.asset_db)
+
+    schedule_timezone = TZ.gettz(timezone_id)
 
     print(f"for timezone {schedule_timezone}")
 
-    subevents = list(map(lambda el: SubeventSchedule.from_xml(schedule_timezone, el), schedule_xml.xpath("//subevent[subevent_id]")))
+    cache = None
+    if args.incremental:
+        cache = ScheduleCache(os.path.join(CACHE_DIR, "schedule.pickle"))
 
-    mapping = VideoMapping.from_files("mapping.xml", "asset-info.csv")
-    parser = ET.XMLParser(remove_comments=True)
-    scheduler = Scheduler.from_xml(ET.parse("liveinfo.xml", parser = parser))
+    with profile_stage("scheduling"):
+        schedule = schedule_subevents(scheduler, mapping, subevents, rooms, cache)
 
-    schedule = dict()
-    for se in subevents:
-        if not se.room in rooms:
-            continue
-        schedule = merge_schedule_dicts(schedule, scheduler.schedule(mapping, se))
+    if cache != None:
+        cache.save(partial=schedule_filter != None)
+        print(f"rescheduled {cache.rescheduled} of {len(cache.used)} subevents")
+
+    with profile_stage("compaction"):
+        schedule = compact_rooms(scheduler, schedule)
     
-    room_playlists = dict()
-    for room, evts in schedule.items():
-        evts.sort(key=lambda evt: evt.start)
-        room_playlists[room] = list(map(lambda evt: evt.make_playlist_element(), evts))
-        validate_playlist(room_playlists[room])
-        
-    # TODO: insert filler elements
-    for r in room_ids:
-        current_room = base_room + r
-        print(f"Generating Playlist for {current_room}")
-        # a single event_id can appear more than once 
-        # (they're duplicated for mirrored events)
-        # so we can't build a map based on them. Only slot_ids are unique.
-        
-        # generate playlist for a room    
-        root = ET.Element("playlist")
-        
-        listmeta = ET.Element("list")
-        name = ET.Element("name")
-        name.text = current_room
-        listmeta.append(name)
-        root.append(listmeta)
-
-        eventlist = ET.Element("eventlist")
-        eventlist.set("timeinmilliseconds", "true")
-        root.append(eventlist)
-        playlist = list(room_playlists[current_room])
-        fillers = gen_fillers(r, playlist)
-        playlist.extend(fillers)
-        playlist_xml = map (PlaylistEvent.to_xml, filter(lambda evt: evt.duration.total_seconds() > 0, playlist))
-        eventlist.extend(list(playlist_xml))
-
-        # write it to a file
-        output_file = base_output_file + r + ".xml"
-        print(f"writing to file {output_file}")
-        with open(output_file, "wb") as xf:
-            xf.write(ET.tostring(root, pretty_print=True, xml_declaration=True, encoding='utf-8', standalone=True))
-
-    output_session_chair_file = base_output_file+ "_chair.xml"
-    chair_xml_root = make_chair_xml(room_playlists, scheduler)
-    print(f"writing to file {output_session_chair_file}")
-    with open(output_session_chair_file, "wb") as xf:
-        xf.write(ET.tostring(chair_xml_root, pretty_print=True, xml_declaration=True, encoding='utf-8', standalone=True))
+    with profile_stage("playlists"):
+        room_playlists = make_room_playlists(schedule)
+
+    if args.command == "onair":
+        query_onair(args, room_playlists, schedule_timezone)
+        return
         
+    if schedule_filter != None:
+        # a partial run only rewrites the playlists it was asked for, the chair file stays as it was;
+        # the playlists of a time window only cover part of the room, so they go next to the published ones
+        print(f"partial run: {len(subevents)} subevents")
+        window = schedule_filter.start != None or schedule_filter.end != None
+        write_outputs(room_playlists, scheduler, timezone_id, args.jobs,
+                      only_rooms=[base_room + r for r in write_ids], chair=False, diff=args.diff,
+                      suffix=WINDOW_SUFFIX if window else "")
+    else:
+        write_outputs(room_playlists, scheduler, timezone_id, args.jobs, diff=args.diff, chair_format=args.chair_format)
+
+    if profile != None:
+        profile.write(args.profile)
         
     # TODO: find filler events in the timeline
     # TODO: Some manual events whose durations we don't know, cut through filler or zoom room (ANI: I don't undrstand this)
     # TODO: maybe take file names are arguments to the script.
     
     print("bye")
+
+if __name__ == '__main__':
+    main()
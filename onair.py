@@ -0,0 +1,133 @@
+# "What is on air" queries over the room timelines.
+#
+# Every room gets a static interval tree over its events: the events sorted
+# by start time plus a max-heap style array of the latest end time under each
+# node. "What is playing at t" and "what overlaps [a, b)" walk down only the
+# nodes that can still hold an event ending after t (O(log n + k)),
+# "what starts next" is a bisect and a slice.
+#
+# Times are integer microseconds since the epoch (timecode.datetime_to_micros),
+# which is what all the timezone aware datetimes turn into.
+
+import bisect
+
+import timecode
+
+to_micros = timecode.datetime_to_micros
+
+
+class IntervalIndex:
+    """
+    Static interval tree over (start, end, item) triples, end exclusive
+    """
+    def __init__(self, intervals):
+        # stable, so events starting together stay in playlist order
+        intervals = sorted(intervals, key=lambda i: i[0])
+        self.starts = [i[0] for i in intervals]
+        self.ends = [i[1] for i in intervals]
+        self.items = [i[2] for i in intervals]
+        # max_end[node] is the latest end in the subtree of node, the leaves are at size..size+n-1
+        self.size = 1
+        while self.size < len(intervals):
+            self.size *= 2
+        self.max_end = [None] * (2 * self.size)
+        for i, end in enumerate(self.ends):
+            self.max_end[self.size + i] = end
+        for node in range(self.size - 1, 0, -1):
+            left, right = self.max_end[2 * node], self.max_end[2 * node + 1]
+            self.max_end[node] = left if right == None or (left != None and left >= right) else right
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, end):
+        """
+        Positions of the intervals overlapping [start, end), in start order
+        """
+        # only the ones starting before end can overlap, and of those only the ones ending after start
+        stop = bisect.bisect_left(self.starts, end)
+        found = []
+        self._collect(1, 0, self.size, stop, start, found)
+        return found
+
+    def _collect(self, node, lo, hi, stop, after, found):
+        if lo >= stop or self.max_end[node] == None or self.max_end[node] <= after:
+            return
+        if node >= self.size:
+            found.append(lo)
+            return
+        mid = (lo + hi) // 2
+        self._collect(2 * node, lo, mid, stop, after, found)
+        self._collect(2 * node + 1, mid, hi, stop, after, found)
+
+    def at(self, when):
+        """
+        Items running at when
+        """
+        return [self.items[i] for i in self.overlapping(when, when + 1)]
+
+    def between(self, start, end):
+        """
+        Items running at some point in [start, end)
+        """
+        return [self.items[i] for i in self.overlapping(start, end)]
+
+    def starting(self, start, end):
+        """
+        Items starting in [start, end)
+        """
+        return self.items[bisect.bisect_left(self.starts, start):bisect.bisect_left(self.starts, end)]
+
+    def next(self, when, n):
+        """
+        The n first items starting at or after when
+        """
+        first = bisect.bisect_left(self.starts, when)
+        return self.items[first:first + n]
+
+
+class OnAirIndex:
+    """
+    One IntervalIndex per room over PlaylistEvents (anything with an aware
+    onairtime datetime and a duration timedelta). Queries take aware datetimes.
+    """
+    def __init__(self, room_events):
+        self.rooms = dict()
+        for room, events in room_events.items():
+            self.rooms[room] = IntervalIndex(
+                (to_micros(evt.onairtime), to_micros(evt.onairtime + evt.duration), evt) for evt in events)
+
+    def _indexes(self, room):
+        if room == None:
+            return list(self.rooms.items())
+        return [(room, self.rooms[room])]
+
+    def at(self, when, room=None):
+        """
+        [(room, event)] of the events on air at when (in room or all the rooms)
+        """
+        micros = to_micros(when)
+        return [(r, evt) for r, index in self._indexes(room) for evt in index.at(micros)]
+
+    def between(self, start, end, room=None):
+        """
+        [(room, event)] of the events on air at some point in [start, end)
+        """
+        start, end = to_micros(start), to_micros(end)
+        return [(r, evt) for r, index in self._indexes(room) for evt in index.between(start, end)]
+
+    def starting(self, start, end, room=None):
+        """
+        [(room, event)] of the events starting in [start, end), ordered by start
+        """
+        start, end = to_micros(start), to_micros(end)
+        found = [(r, evt) for r, index in self._indexes(room) for evt in index.starting(start, end)]
+        return sorted(found, key=lambda re: re[1].onairtime)
+
+    def next(self, when, n, room=None):
+        """
+        [(room, event)] of the n first events starting at or after when
+        """
+        micros = to_micros(when)
+        found = [(r, evt) for r, index in self._indexes(room) for evt in index.next(micros, n)]
+        return sorted(found, key=lambda re: re[1].onairtime)[:n]
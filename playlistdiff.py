@@ -0,0 +1,148 @@
+#! /usr/local/bin/python3
+
+# Change sets between two versions of a room playlist, so the playout system
+# only has to take in what changed rather than the whole multi-day file.
+#
+# Events are compared on the fields the generator fills in (FIELDS); the rest
+# of an <event> is constant. They are aligned in passes, each one a hash
+# lookup per event (plus sorting the leftovers), so a diff is near linear:
+#   1. same onairtime, title and media/live id: the same event, maybe updated
+#   2. same title and id: the event moved (k-th left over old one with the
+#      k-th left over new one, in onairtime order)
+#   3. same onairtime: something else now plays in that slot
+#   4. whatever is left was deleted or inserted
+# Every pairing costs one update where a delete and an insert would cost two.
+#
+# The change set is compact json:
+#   {"fields": FIELDS, "old": events before, "new": events after,
+#    "changes": [["-", old index],
+#                ["~", old index, new index, {field: new value}],
+#                ["+", new index, [value of every field]]]}
+# deletes first, then updates and inserts in new playlist order.
+#
+# $ ./playlistdiff.py OLD.xml NEW.xml [--output CHANGES.json] [--verify]
+
+import argparse
+import json
+import sys
+
+import lxml.etree as ET
+
+FIELDS = ("category", "title", "duration", "onairtime", "id_tag", "id", "recordingPattern", "recording")
+ID_TAGS = ("mediaid", "liveid")
+ONAIRTIME, TITLE, ID_TAG, ID = (FIELDS.index(f) for f in ("onairtime", "title", "id_tag", "id"))
+
+
+def read_playlist(playlist_file):
+    """
+    The FIELDS tuple of every <event> of playlist_file, in file order.
+    Streams the file, clearing the events as it goes.
+    """
+    records = []
+    for _, elem in ET.iterparse(playlist_file, tag="event"):
+        fields = dict()
+        for child in elem:
+            if child.tag in ID_TAGS:
+                fields["id_tag"] = child.tag
+                fields["id"] = child.text or ""
+            else:
+                fields[child.tag] = child.text or ""
+        records.append(tuple(fields.get(f, "") for f in FIELDS))
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return records
+
+def pair_up(old, new, old_left, new_left, key, pairs):
+    """
+    Pairs the left over old and new records (positions in ascending order)
+    that have the same key, the k-th old one with the k-th new one in
+    onairtime order. Returns what is still left over on both sides.
+    """
+    by_key = dict()
+    for i in sorted(old_left, key=lambda i: old[i][ONAIRTIME]):
+        by_key.setdefault(key(old[i]), []).append(i)
+    taken = dict() # key => how many of its old ones are paired up
+    still_new = []
+    for j in sorted(new_left, key=lambda j: new[j][ONAIRTIME]):
+        k = key(new[j])
+        candidates = by_key.get(k)
+        n = taken.get(k, 0)
+        if candidates != None and n < len(candidates):
+            pairs.append((candidates[n], j))
+            taken[k] = n + 1
+        else:
+            still_new.append(j)
+    still_old = [i for k, candidates in by_key.items() for i in candidates[taken.get(k, 0):]]
+    return sorted(still_old), sorted(still_new)
+
+def diff_playlists(old, new):
+    """
+    The change set (see above) that turns the records old into new
+    """
+    pairs = []
+    old_left, new_left = range(len(old)), range(len(new))
+    for key in (lambda r: (r[ONAIRTIME], r[TITLE], r[ID_TAG], r[ID]),
+                lambda r: (r[TITLE], r[ID_TAG], r[ID]),
+                lambda r: r[ONAIRTIME]):
+        old_left, new_left = pair_up(old, new, old_left, new_left, key, pairs)
+
+    changes = [["-", i] for i in old_left]
+    ordered = [] # (new index, change)
+    for i, j in pairs:
+        updated = {f: b for f, a, b in zip(FIELDS, old[i], new[j]) if a != b}
+        if len(updated) > 0:
+            ordered.append((j, ["~", i, j, updated]))
+    ordered.extend((j, ["+", j, list(new[j])]) for j in new_left)
+    ordered.sort(key=lambda change: change[0])
+    changes.extend(change for _, change in ordered)
+    return { "fields": list(FIELDS), "old": len(old), "new": len(new), "changes": changes }
+
+def apply_changes(old, change_set):
+    """
+    The records after change_set, in onairtime order (the order within the
+    file isn't part of the change set; the generator sorts by onairtime too,
+    apart from the fillers it appends)
+    """
+    records = dict(enumerate(old))
+    inserted = []
+    for change in change_set["changes"]:
+        if change[0] == "-":
+            del records[change[1]]
+        elif change[0] == "~":
+            fields = dict(zip(FIELDS, records[change[1]]))
+            fields.update(change[3])
+            records[change[1]] = tuple(fields[f] for f in FIELDS)
+        else:
+            inserted.append(tuple(change[2]))
+    return sorted(list(records.values()) + inserted, key=lambda r: r[ONAIRTIME])
+
+def write_change_set(change_set, output):
+    """
+    Compact json, one line
+    """
+    json.dump(change_set, output, separators=(",", ":"), ensure_ascii=False)
+    output.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prints the changes between two versions of a playlist")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--output", help="write the change set to this file instead of stdout")
+    parser.add_argument("--verify", action="store_true",
+                        help="check that applying the change set to old gives new (in onairtime order)")
+    args = parser.parse_args()
+
+    old, new = read_playlist(args.old), read_playlist(args.new)
+    change_set = diff_playlists(old, new)
+    if args.output != None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            write_change_set(change_set, f)
+    else:
+        write_change_set(change_set, sys.stdout)
+    if args.verify:
+        ok = sorted(apply_changes(old, change_set)) == sorted(new)
+        print(f"{len(change_set['changes'])} changes, {'verified' if ok else 'DO NOT APPLY CLEANLY'}", file=sys.stderr)
+        if not ok:
+            sys.exit(1)
@@ -0,0 +1,175 @@
+# 25 fps timecodes, as the playout system reads and writes them:
+#   durations   HH:MM:SS:FF
+#   onairtimes  YYYY-MM-DDTHH:MM:SS:FF (UTC)
+# Everything goes through integer frame counts (frames since the epoch for
+# onairtimes), so encoding and decoding is plain integer math with no float
+# rounding. A frame is 40ms; times in between are rounded down.
+#
+# The UTC offsets of timezones are cached, as schedules keep coming back to
+# the same handful of wall clock times.
+
+import datetime
+
+FPS = 25
+MICROS_PER_FRAME = 1000000 // FPS
+FRAMES_PER_DAY = 24 * 60 * 60 * FPS
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def timedelta_to_frames(delta):
+    return (delta // ONE_MICROSECOND) // MICROS_PER_FRAME
+
+def frames_to_timedelta(frames):
+    return datetime.timedelta(microseconds=frames * MICROS_PER_FRAME)
+
+def format_duration(frames):
+    """
+    number of frames => "HH:MM:SS:FF"
+    """
+    seconds, frames = divmod(frames, FPS)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}:{frames:02d}"
+
+def parse_duration(text):
+    """
+    "HH:MM:SS:FF" => number of frames
+    """
+    hours, minutes, seconds, frames = text.split(':')
+    return ((int(hours) * 60 + int(minutes)) * 60 + int(seconds)) * FPS + int(frames)
+
+
+_utc_offsets = dict() # id(timezone) => (timezone, {wall clock: offset}); tzinfos aren't hashable
+
+def local_to_epoch(local, timezone):
+    """
+    Turns wall clock seconds since the epoch in timezone into real seconds since the epoch.
+    The offset only depends on the wall clock time, so it is cached.
+    """
+    _, offsets = _utc_offsets.setdefault(id(timezone), (timezone, dict()))
+    offset = offsets.get(local)
+    if offset == None:
+        wall = datetime.datetime.fromtimestamp(local, datetime.timezone.utc).replace(tzinfo=timezone)
+        offset = int(wall.utcoffset().total_seconds())
+        offsets[local] = offset
+    return local - offset
+
+_hour_offsets = dict() # id(timezone) => (timezone, {(wall clock hour, fold): offset in microseconds})
+
+def utc_offset_micros(when):
+    """
+    UTC offset of an aware datetime, in microseconds. Cached per timezone and
+    wall clock hour (unless the offset changes within that hour).
+    """
+    timezone = when.tzinfo
+    _, offsets = _hour_offsets.setdefault(id(timezone), (timezone, dict()))
+    key = (when.toordinal() * 24 + when.hour, when.fold)
+    offset = offsets.get(key)
+    if offset == None:
+        offset = when.utcoffset() // ONE_MICROSECOND
+        hour = when.replace(minute=0, second=0, microsecond=0)
+        last = hour.replace(minute=59, second=59, microsecond=999999)
+        if hour.utcoffset() == last.utcoffset() == when.utcoffset():
+            offsets[key] = offset
+    return offset
+
+_epoch_offsets = dict() # id(timezone) => (timezone, {hour since the epoch: offset in seconds})
+
+def epoch_utc_offset(seconds, timezone):
+    """
+    UTC offset of timezone, in seconds, at (integer) seconds since the epoch.
+    Cached per hour (unless the offset changes within that hour).
+    """
+    _, offsets = _epoch_offsets.setdefault(id(timezone), (timezone, dict()))
+    hour = seconds // 3600
+    offset = offsets.get(hour)
+    if offset == None:
+        def offset_at(when):
+            return int(datetime.datetime.fromtimestamp(when, timezone).utcoffset().total_seconds())
+        offset = offset_at(seconds)
+        if offset_at(hour * 3600) == offset_at(hour * 3600 + 3599) == offset:
+            offsets[hour] = offset
+    return offset
+
+def format_utc_offset(seconds):
+    """
+    seconds => "+HH:MM" (or "+HH:MM:SS"), the way isoformat() writes UTC offsets
+    """
+    sign = "-" if seconds < 0 else "+"
+    minutes, seconds = divmod(abs(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if seconds != 0:
+        return f"{sign}{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+def epoch_isoformat(seconds, timezone):
+    """
+    datetime.fromtimestamp(seconds, timezone).isoformat(), with the UTC offset cached
+    """
+    offset = epoch_utc_offset(seconds, timezone)
+    return (EPOCH + datetime.timedelta(seconds=seconds + offset)).isoformat() + format_utc_offset(offset)
+
+def isoformat(when):
+    """
+    when.isoformat(), with the UTC offset of an aware datetime cached (see utc_offset_micros)
+    """
+    if when.tzinfo == None:
+        return when.isoformat()
+    offset, micros = divmod(utc_offset_micros(when), 1000000)
+    if micros != 0:
+        return when.isoformat()
+    return when.replace(tzinfo=None).isoformat() + format_utc_offset(offset)
+
+def datetime_to_micros(when):
+    """
+    Microseconds since the epoch (UTC) of a datetime; naive ones are taken as UTC
+    """
+    micros = (when.replace(tzinfo=None) - EPOCH) // ONE_MICROSECOND
+    if when.tzinfo != None:
+        micros -= utc_offset_micros(when)
+    return micros
+
+def datetime_to_frames(when):
+    """
+    Frames since the epoch (UTC) of a datetime; naive ones are taken as UTC
+    """
+    return datetime_to_micros(when) // MICROS_PER_FRAME
+
+def frames_to_datetime(frames, timezone=None):
+    """
+    The datetime of frames since the epoch: naive UTC, or in timezone if there is one
+    """
+    when = EPOCH + frames_to_timedelta(frames)
+    if timezone != None:
+        when = when.replace(tzinfo=datetime.timezone.utc).astimezone(timezone)
+    return when
+
+
+_days = dict() # day number since the epoch <=> "YYYY-MM-DD", both ways
+
+def format_onairtime(frames):
+    """
+    frames since the epoch => "YYYY-MM-DDTHH:MM:SS:FF" (UTC)
+    """
+    day, frames = divmod(frames, FRAMES_PER_DAY)
+    date = _days.get(day)
+    if date == None:
+        date = datetime.date.fromordinal(EPOCH_ORDINAL + day).isoformat()
+        _days[day] = date
+        _days[date] = day
+    return f"{date}T{format_duration(frames)}"
+
+def parse_onairtime(text):
+    """
+    "YYYY-MM-DDTHH:MM:SS:FF" => frames since the epoch
+    """
+    date = text[:10]
+    day = _days.get(date)
+    if day == None:
+        day = datetime.date.fromisoformat(date).toordinal() - EPOCH_ORDINAL
+        _days[day] = date
+        _days[date] = day
+    return day * FRAMES_PER_DAY + parse_duration(text[11:22])
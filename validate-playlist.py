@@ -1,7 +1,7 @@
 #! /usr/local/bin/python3
 
 # We have multiple playlists files (one for each room) that we have generated from
-# the big horrible ad-hoc mess of schedule and mapping and what not xml/cvs files 
+# the big horrible ad-hoc mess of schedule and mapping and what not xml/cvs files
 
 # We want to validate that the playlist is valid with these characteristics:
 # - No events overlap
@@ -9,88 +9,264 @@
 # - There are no gaps in the playlist (This is needed for making sure the stream doesn't die)
 # - don't replay prerecords that haven't happened yet
 
-import math
-from itertools import *
+# The playlists are streamed <event> by <event>, so this doesn't need to hold
+# a playlist in memory (or to import the generator). Times are kept as
+# integer frame counts (see timecode.py) and only turned back into datetimes
+# for the warnings.
+
+import argparse
+import concurrent.futures
+import heapq
+import json
+import sys
+import time
 
-import lxml
-# import csv
-# import datetime, dateutil
-# import dateutil.tz as TZ
 import lxml.etree as ET
 
-import importlib.machinery
-import importlib.util
+import timecode
+
+# Same as in gen-playlist.py
+base_output_file = "SPLASH21-playlist-demo-Zurich-"
+room_ids = ["D", "B", "C"]
 
-# Import gen-playlist
-loader = importlib.machinery.SourceFileLoader( 'gen-playlist.py', './gen-playlist.py' )
-spec = importlib.util.spec_from_loader( 'gen-playlist.py', loader )
-gpl = importlib.util.module_from_spec( spec )
-loader.exec_module( gpl )
 
-def validate_adjacent_events(pl):
+class PlaylistEntry:
     """
-    For a room, we don't want multiple events running or 
-    two adjacent events overlap each other.
+    What the checks need to know about an <event>
     """
-    print("Making sure there are no over runs on adjacent events")
-    sorted_pl = sorted(pl, key=lambda x: x.onairtime)
-    adj_evs = list(gpl.window(sorted_pl, 2))
-    for (e1, e2) in adj_evs:
-        if e2.onairtime < e1.onairtime + e1.duration:
-            print(f"Warning: {e1.title} ({e1.onairtime}-{e1.duration.total_seconds()})\n"
-                  + f"runs over {e2.title} ({e2.onairtime}-{e2.duration.total_seconds()})\n"
-                  + f"by {((e1.onairtime + e1.duration) - e2.onairtime).total_seconds()} secs")
-    return pl
+    __slots__ = ("index", "title", "start", "duration", "recordingPat")
+
+    def __init__(self, index, title, start, duration, recordingPat):
+        self.index = index
+        self.title = title
+        self.start = start
+        self.duration = duration
+        self.recordingPat = recordingPat
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def from_xml(index, xml):
+        title = start = duration = recordingPat = None
+        for child in xml:
+            if child.tag == "title":
+                title = child.text.strip()
+            elif child.tag == "onairtime":
+                start = timecode.parse_onairtime(child.text)
+            elif child.tag == "duration":
+                duration = timecode.parse_duration(child.text)
+            elif child.tag == "recordingPattern":
+                recordingPat = child.text
+        return PlaylistEntry(index, title, start, duration, recordingPat)
 
 
-def find_duplicates(sequence):
+def stream_events(playlist_file, first=0, stop=None):
     """
-    source: https://www.iditect.com/guide/python/python_howto_find_the_duplicates_in_a_list.html
+    Yields the PlaylistEntry of every <event> in playlist_file (or only the
+    ones numbered first..stop-1), clearing the parsed elements as it goes
     """
-    first_seen = set()
-    first_seen_add = first_seen.add  
-    duplicates = set(i for i in sequence if i in first_seen or first_seen_add(i) )
-    # turn the set into a list (as requested)
-    return duplicates 
-            
-def recording_pattern_is_unique(pl):
+    index = 0
+    for _, elem in ET.iterparse(playlist_file, tag="event"):
+        if index >= first:
+            yield PlaylistEntry.from_xml(index, elem)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+        index += 1
+        if stop != None and index >= stop:
+            return
+
+def overrun_warning(e1, e2):
+    to_datetime, to_timedelta = timecode.frames_to_datetime, timecode.frames_to_timedelta
+    return (f"Warning: {e1.title} ({to_datetime(e1.start)}-{to_timedelta(e1.duration).total_seconds()})\n"
+            + f"runs over {e2.title} ({to_datetime(e2.start)}-{to_timedelta(e2.duration).total_seconds()})\n"
+            + f"by {to_timedelta(e1.end - e2.start).total_seconds()} secs")
+
+
+class AdjacencyCheck:
+    """
+    For a room, we don't want multiple events running or
+    two adjacent events overlap each other.
+    Fed the events in onairtime order, only remembers the last one.
+    """
+    def __init__(self):
+        self.prev = None
+        self.warnings = []
+
+    def add(self, evt):
+        if self.prev != None and evt.start < self.prev.end:
+            self.warnings.append(overrun_warning(self.prev, evt))
+        self.prev = evt
+
+
+class RecordingPatternCheck:
     """
     Make sure there is only one recording pattern for an event
     We have mirrors and only the first event should be LIVE, the other event should be PROGRAM
     """
-    print("Making sure there are no duplicate recordingPatterns")
-    # print(len(list(pl)))
-    
-    reps = list(map( lambda e: e.recordingPat
-                   , filter(lambda e: e.recordingPat != None
-                            , pl)))
-    #  print(list(map(lambda e: e.recordingPat, pl)))
-    dups = find_duplicates(reps)
-    if len(dups) > 1:
-        print(f"Warning: Found duplicate record patterns {dups}")
-    
-            
-def validate_playlist(pl):
+    def __init__(self):
+        self.first_seen = set()
+        self.duplicates = set()
 
-    validate_adjacent_events(pl)
+    def add(self, evt):
+        if evt.recordingPat == None:
+            return
+        if evt.recordingPat in self.first_seen:
+            self.duplicates.add(evt.recordingPat)
+        else:
+            self.first_seen.add(evt.recordingPat)
 
-    recording_pattern_is_unique(pl)
+    @property
+    def warnings(self):
+        if len(self.duplicates) > 1:
+            return [f"Warning: Found duplicate record patterns {self.duplicates}"]
+        return []
 
-            
 
-if __name__ == "__main__":
-    for r in gpl.room_ids:
-        file_for_room = gpl.base_output_file + r + ".xml"
-    
-        pl_xml = ET.parse(file_for_room)
-    
-        pl_events = list(map(gpl.PlaylistEvent.from_xml, pl_xml.xpath("/playlist/eventlist/event")))
+MAX_STREAMS = 8 # most stretches merged by streaming them side by side, each one parses the file again
+
+def check_adjacent_events(playlist_file, runs):
+    """
+    Checks the events of runs (the index ranges of playlist_file that are in
+    onairtime order) by merging them back into one timeline, streaming every
+    run separately. The generator appends the fillers at the end, so there
+    are usually two. With more than MAX_STREAMS runs the file is streamed
+    once more and its events sorted in memory instead.
+    """
+    check = AdjacencyCheck()
+    if len(runs) > MAX_STREAMS:
+        # sorted is stable, equal onairtimes stay in file order
+        for evt in sorted(stream_events(playlist_file), key=lambda e: e.start):
+            check.add(evt)
+        return check.warnings
+    # merge is stable, so equal onairtimes stay in file order like sorted() would keep them
+    streams = [stream_events(playlist_file, first, stop) for first, stop in runs]
+    for evt in heapq.merge(*streams, key=lambda e: e.start):
+        check.add(evt)
+    return check.warnings
+
+def validate_playlist(playlist_file):
+    """
+    Validates a playlist file in one streaming pass (two if its events aren't
+    in onairtime order). Returns a ValidationResult.
+    """
+    started = time.perf_counter()
+    adjacency = AdjacencyCheck()
+    recordings = RecordingPatternCheck()
+    runs = [] # (first, stop) of the stretches of events in onairtime order
+    first = count = 0
+    for evt in stream_events(playlist_file):
+        if adjacency.prev != None and evt.start < adjacency.prev.start:
+            runs.append((first, evt.index))
+            first = evt.index
+        adjacency.add(evt)
+        recordings.add(evt)
+        count += 1
+    runs.append((first, count))
+
+    overruns = adjacency.warnings
+    if len(runs) > 1:
+        overruns = check_adjacent_events(playlist_file, runs)
+    return ValidationResult(playlist_file, count, overruns, recordings.warnings,
+                            recordings.first_seen, time.perf_counter() - started)
 
-        print(f"loaded {len(pl_events)} events from {file_for_room} for validation")
 
-        validate_playlist(pl_events)
-        
+class ValidationResult:
+    """
+    What validating one playlist file found
+    """
+    def __init__(self, playlist_file, events, overruns, duplicates, recording_patterns, seconds):
+        self.playlist_file = playlist_file
+        self.events = events
+        self.overruns = overruns
+        self.duplicates = duplicates
+        self.recording_patterns = recording_patterns
+        self.seconds = seconds
+
+    def print_report(self):
+        print(f"loaded {self.events} events from {self.playlist_file} for validation")
+
+        print("Making sure there are no over runs on adjacent events")
+        for warning in self.overruns:
+            print(warning)
+
+        print("Making sure there are no duplicate recordingPatterns")
+        for warning in self.duplicates:
+            print(warning)
+
         print(f"validation done")
 
-        
-    
+    def to_json(self):
+        return { "file": self.playlist_file
+               , "events": self.events
+               , "overruns": self.overruns
+               , "duplicates": self.duplicates
+               , "seconds": round(self.seconds, 6) }
+
+
+def cross_room_duplicates(results):
+    """
+    Recording patterns that show up in more than one playlist file, with the files they show up in
+    """
+    files_for_pattern = dict()
+    for result in results:
+        for pattern in result.recording_patterns:
+            files_for_pattern.setdefault(pattern, []).append(result.playlist_file)
+    return {pattern: files for pattern, files in files_for_pattern.items() if len(files) > 1}
+
+def validate_playlists(files, jobs=1):
+    """
+    Validates every file, each in its own worker process when jobs > 1.
+    Returns the ValidationResults in the order of files.
+    """
+    if jobs > 1 and len(files) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(files))) as pool:
+            return list(pool.map(validate_playlist, files))
+    return [validate_playlist(f) for f in files]
+
+def merged_report(results, seconds):
+    return { "files": [result.to_json() for result in results]
+           , "events": sum(result.events for result in results)
+           , "warnings": sum(len(result.overruns) + len(result.duplicates) for result in results)
+           , "cross_room_duplicates": cross_room_duplicates(results)
+           , "seconds": round(seconds, 6) }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Validates the generated room playlists")
+    parser.add_argument("files", nargs="*",
+                        help="playlist files to validate (default: the room playlists)")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="validate the files in up to N worker processes, one file each (default: 1, no workers)")
+    parser.add_argument("--json", action="store_true",
+                        help="print the merged report as json instead of text")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = args.files
+    if len(files) == 0:
+        files = [base_output_file + r + ".xml" for r in room_ids]
+
+    started = time.perf_counter()
+    results = validate_playlists(files, args.jobs)
+    report = merged_report(results, time.perf_counter() - started)
+
+    if args.json:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+
+    for result in results:
+        result.print_report()
+
+    if len(results) > 1:
+        print("Making sure there are no duplicate recordingPatterns across rooms")
+        for pattern, pattern_files in report["cross_room_duplicates"].items():
+            print(f"Warning: recording pattern {pattern} is in {', '.join(pattern_files)}")
+    print(f"validated {report['events']} events in {len(results)} files in {report['seconds']:.3f}s"
+          + f" ({report['warnings']} warnings)")
+
+
+if __name__ == "__main__":
+    main()